@@ -226,11 +226,11 @@ def find_basic_stats(args, files_dict, dir):
             slice_fd = nltk.FreqDist()
             stat_dict["stat_name"].append(start_year)
             stat_dict["num_docs"].append(len(files))
-            for i in tqdm(range(len(files))):
+            for file in tqdm(files):
                 if args.tsv_corpus:
-                    toks = files[i].lower().split()
+                    toks = file.lower().split()
                 else:
-                    with open(files[i], "r") as f:
+                    with open(file, "r") as f:
                         # Increment token count
                         toks = f.read().lower().split()
                 # Update frequency distribution for time slice
@@ -383,9 +383,13 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--tsv_corpus', type=str, default='path to tsv file containing corpus')
+    parser.add_argument('--doc_index', default=False, action="store_true", help='whether or not to read documents of the tsv corpus through a document index (built next to it the first time) instead of loading the whole file')
+    parser.add_argument('--lazy_slices', default=False, action="store_true", help='whether or not to read the documents of each time slice from the tsv corpus every time they are used instead of keeping them in memory (uses the document index, see --doc_index)')
     parser.add_argument('--basic_stats', default=False, action='store_true', help='whether to find basic corpus stats only.')
     parser.add_argument('--corpus_dir', type=str, default="/work/clambert/thesis-data/sessionsAndOrdinarys-txt-stats", help='directory containing corpus')
     parser.add_argument('--year_split', type=int, default=100, help='number of years to calculate stats for')
+    parser.add_argument('--year_range', type=str, default='', help='ranges of years to split corpus into, overriding --year_split (e.g., "1674:1834-10", "1670:1840/10" for decades or "1689:1702,1702:1714")')
+    parser.add_argument('--london_lives_index', type=str, default='', help='path to index of London Lives document years written by data_reader.py (to split London Lives documents by year)')
     parser.add_argument('--num_top_words', type=int, default=10, help='number of top words to record')
     parser.add_argument('--latin_dict', type=str, default="/work/clambert/thesis-data/latin_dict.txt", help='text file containing latin dictionary')
     parser.add_argument('--english_words', type=str, default = "/work/clambert/thesis-data/bnc_lexicon.txt", help='optional path to file containing english words')
@@ -66,7 +66,7 @@ def before_train(args):
         else:
             # Merge all files from a year chunk into one file
             for file in files:
-                with open(file) as f:
+                with open_file(file) as f:
                     joined_docs.append(f.read())
 
         documents.append("\n".join(joined_docs))
@@ -81,8 +81,11 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--tsv_corpus', type=str, default="", help='path to tsv file containing corpus')
+    parser.add_argument('--doc_index', default=False, action="store_true", help='whether or not to read documents of the tsv corpus through a document index (built next to it the first time) instead of loading the whole file')
     parser.add_argument('--corpus_dir', type=str, default="/work/clambert/thesis-data/sessionsAndOrdinarys-txt-stats", help='directory containing corpus')
     parser.add_argument('--save_model_dir', type=str, default="/work/clambert/models/", help='base directory for saving model directory')
     parser.add_argument('--year_split', type=int, default=100, help='number of years to include in each chunk of corpus (run tf-idf over each chunk)')
+    parser.add_argument('--year_range', type=str, default='', help='ranges of years to split corpus into, overriding --year_split (e.g., "1674:1834-10", "1670:1840/10" for decades or "1689:1702,1702:1714")')
+    parser.add_argument('--london_lives_index', type=str, default='', help='path to index of London Lives document years written by data_reader.py (to split London Lives documents by year)')
     args = parser.parse_args()
     main(args)
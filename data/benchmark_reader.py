@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# benchmark_reader.py
+#
+# Time conversion of XML files to text with data_reader.py, either comparing
+# text assembly approaches or running a benchmark suite over flag combinations.
+#
+###############################################################################
+
+import sys, argparse, os, time, html, re, subprocess, tempfile, tracemalloc, itertools, shutil
+import xml.etree.ElementTree as ET
+from data_reader import encode_annotations, encode_element, iter_trials
+import make_synthetic_xml
+sys.path.append('../')
+from utils import *
+
+def legacy_text(args, xml_path):
+    """
+        Convert an XML file to text by encoding the whole tree, then serializing
+        it with ElementTree.tostring and cleaning up the escaped bytes string
+        (how data_reader.py assembled text before single-pass assembly).
+
+        input:
+            args (argparse object): input arguments
+            xml_path (str): path to XML file
+
+        returns text of XML file
+    """
+    state = {"xml_path": xml_path, "ready_for_date": False, "skip": True}
+    root = ET.parse(xml_path).getroot()
+    for elem in root.iter():
+        encode_element(args, elem, state)
+    text = str(ET.tostring(root, encoding='ASCII', method='text'))
+    text = html.unescape(text).replace("\\t", " ").replace("\\n", "\n")
+    text = re.sub("\ +", " ", text)
+    return text[2:-1]
+
+def time_call(repeat, func, *func_args):
+    """
+        Call a function repeat times.
+
+        returns fastest time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*func_args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def compare_assembly(args, files):
+    """
+        Time legacy and single-pass text assembly on each file and print the
+        per-file speedup.
+
+        input:
+            args (argparse object): input arguments
+            files (list): paths to XML files
+    """
+    print("file\tlegacy_ms\tsingle_pass_ms\tspeedup")
+    total_legacy = total_new = 0
+    for file in files:
+        legacy = time_call(args.repeat, legacy_text, args, file)
+        new = time_call(args.repeat, encode_annotations, args, file, "")
+        total_legacy += legacy
+        total_new += new
+        print("\t".join([os.path.basename(file), str(round(legacy * 1000, 2)),
+                         str(round(new * 1000, 2)), str(round(legacy / new, 2))]))
+    print("\t".join(["total", str(round(total_legacy * 1000, 2)),
+                     str(round(total_new * 1000, 2)),
+                     str(round(total_legacy / total_new, 2))]))
+
+def flag_args(annotations, split_trials, stream):
+    """
+        Build arguments for data_reader.py functions from one combination of
+        flags.
+    """
+    return argparse.Namespace(encode_annotations_general=annotations == "general",
+                              encode_annotations_specific=annotations == "specific",
+                              split_trials=split_trials, stream=stream,
+                              london_lives=False, tsv=1)
+
+def flag_str(annotations, split_trials, stream):
+    """
+        Describe one combination of flags as on the data_reader.py command line.
+    """
+    flags = ["--encode_annotations_" + annotations] if annotations else []
+    if split_trials: flags.append("--split_trials")
+    if stream: flags.append("--stream")
+    return flags
+
+def time_stage(repeat, func, files):
+    """
+        Call func on every file repeat times, then once more while tracing
+        memory allocations.
+
+        returns fastest time in seconds and peak traced memory in megabytes
+    """
+    seconds = time_call(repeat, lambda: [func(file) for file in files])
+    tracemalloc.start()
+    for file in files: func(file)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2**20
+
+def time_main(repeat, files, flags, tmp_dir):
+    """
+        Run data_reader.py on files in a separate process repeat times.
+
+        returns fastest time in seconds and peak resident memory of the
+        process in megabytes
+    """
+    corpus_dir = os.path.join(tmp_dir, "corpus")
+    if not os.path.exists(corpus_dir):
+        os.makedirs(corpus_dir)
+        for file in files:
+            os.symlink(os.path.abspath(file), os.path.join(corpus_dir, os.path.basename(file)))
+    cmd = [sys.executable, "data_reader.py", corpus_dir, "--overwrite"] + flags
+    best, peak = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        best = min(best, time.perf_counter() - start)
+        if status:
+            print(timestamp(), "data_reader.py failed with flags", " ".join(flags), file=sys.stderr)
+        # ru_maxrss is in kilobytes
+        peak = max(peak, usage.ru_maxrss / 2**10)
+    return best, peak
+
+def run_suite(args, files):
+    """
+        Time encode_annotations, iter_trials (--split_trials) and the full
+        data_reader.py main in each combination of annotation and --stream
+        flags, printing files/sec and peak memory for each.
+
+        input:
+            args (argparse object): input arguments
+            files (list): paths to XML files
+    """
+    print("stage\tflags\tfiles\tseconds\tfiles_per_sec\tpeak_mb")
+    def report(stage, flags, seconds, peak):
+        print("\t".join([stage, " ".join(flags) or "-", str(len(files)), str(round(seconds, 3)),
+                         str(round(len(files) / seconds, 2)), str(round(peak, 1))]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for annotations, stream in itertools.product(["", "general", "specific"], [False, True]):
+            flags = flag_str(annotations, False, stream)
+            stage_args = flag_args(annotations, False, stream)
+            report("encode_annotations", flags, *time_stage(args.repeat,
+                   lambda file: encode_annotations(stage_args, file, ""), files))
+
+            flags = flag_str(annotations, True, stream)
+            split_args = flag_args(annotations, True, stream)
+            report("split_trials", flags, *time_stage(args.repeat,
+                   lambda file: list(iter_trials(split_args, file)), files))
+
+            for split_trials in [False, True]:
+                flags = flag_str(annotations, split_trials, stream)
+                report("main", flags, *time_main(args.repeat, files, flags, tmp_dir))
+
+def main(args):
+    files = [f for f in args.xml_files if f.endswith(".xml")]
+    if not files and args.suite:
+        # Benchmark a synthetic corpus instead
+        args.output_dir = tempfile.mkdtemp()
+        print(timestamp(), "Writing synthetic corpus to", args.output_dir, file=sys.stderr)
+        files = make_synthetic_xml.write_corpus(args, args.output_dir)
+    if not files:
+        print(timestamp(), "Please input XML files to benchmark.", file=sys.stderr)
+        exit(1)
+    if args.suite:
+        print(timestamp(), "Running benchmark suite on", len(files), "files...", file=sys.stderr)
+        run_suite(args, files)
+        if not args.xml_files: shutil.rmtree(args.output_dir)
+    else:
+        print(timestamp(), "Timing text assembly on", len(files), "files...", file=sys.stderr)
+        compare_assembly(args, files)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('xml_files', nargs='*', help='XML files to convert (e.g., sessionsPapers/*.xml)')
+    parser.add_argument('--repeat', default=3, type=int, help='number of times to convert each file (fastest time is reported)')
+    parser.add_argument('--encode_annotations_general', default=False, action="store_true", help='whether or not to encode general version of annotations in text')
+    parser.add_argument('--encode_annotations_specific', default=False, action="store_true", help='whether or not to encode specific version of annotations in text')
+    parser.add_argument('--split_trials', default=False, action="store_true", help='whether or not to split data into trials')
+    parser.add_argument('--london_lives', default=False, action="store_true", help='whether or not input is London Lives corpus')
+    parser.add_argument('--tsv', default=1, type=int, help="whether or not to store output as tsv")
+    parser.add_argument('--stream', default=False, action="store_true", help='whether or not to parse XML files incrementally')
+    parser.add_argument('--suite', default=False, action="store_true", help='whether or not to run the benchmark suite over all flag combinations (on a synthetic corpus if no XML files are given)')
+    make_synthetic_xml.add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
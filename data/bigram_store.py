@@ -0,0 +1,128 @@
+###############################################################################
+# bigram_store.py
+#
+# Compact binary file of corpus bigram counts written by ngrams.py. The file is
+# memory-mapped when read, so every process tokenizing in parallel shares the
+# same pages instead of loading its own copy of corpus_bigrams.json.
+#
+# Layout (native byte order, all integers unsigned 64-bit):
+#     magic (8 bytes), number of words, number of bigrams, size of vocab
+#     offsets into the vocab of each word (number of words + 1)
+#     keys of each bigram: (id of first word << 32) | id of second word, sorted
+#     count of each bigram
+#     vocab: UTF-8 words sorted by their bytes, concatenated
+#
+###############################################################################
+
+import mmap, struct, bisect
+from array import array
+
+magic = b"OBBIGRM1"
+header = struct.Struct("=8sQQQ")
+
+def is_bigram_store(path):
+    """
+        Check whether a file is a bigram store (rather than a json file).
+    """
+    with open(path, "rb") as f:
+        return f.read(len(magic)) == magic
+
+def write_bigram_store(path, bigram_dict):
+    """
+        Write bigram counts to a bigram store.
+
+        input:
+            path (str): path to write store to
+            bigram_dict (dict): counts of bigrams (format: {"w1 w2": count})
+    """
+    pairs = [key.split(" ", 1) for key in bigram_dict]
+    vocab = sorted({word.encode() for pair in pairs for word in pair})
+    ids = {word.decode(): i for i, word in enumerate(vocab)}
+
+    offsets = array("Q", [0])
+    for word in vocab:
+        offsets.append(offsets[-1] + len(word))
+    bigrams = sorted(((ids[w1] << 32) | ids[w2], count)
+                     for (w1, w2), count in zip(pairs, bigram_dict.values()))
+    keys = array("Q", (key for key, _ in bigrams))
+    counts = array("Q", (count for _, count in bigrams))
+
+    with open(path, "wb") as f:
+        f.write(header.pack(magic, len(vocab), len(keys), offsets[-1]))
+        offsets.tofile(f)
+        keys.tofile(f)
+        counts.tofile(f)
+        f.write(b"".join(vocab))
+
+class BigramStore:
+    """
+        Read-only view of a bigram store that can be used in place of the
+        dictionary loaded from corpus_bigrams.json: store["w1 w2"] is the count
+        of a bigram and raises KeyError if it was never seen. Words are found by
+        binary search over the sorted vocab and bigrams by binary search over
+        the sorted keys, so nothing is loaded into memory up front.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.num_words, self.num_bigrams, vocab_size = header.unpack_from(self.data)
+        if file_magic != magic:
+            raise ValueError(path + " is not a bigram store")
+
+        start = header.size
+        sections = []
+        for length in [self.num_words + 1, self.num_bigrams, self.num_bigrams]:
+            sections.append(memoryview(self.data)[start:start + 8 * length].cast("Q"))
+            start += 8 * length
+        self.offsets, self.keys, self.counts = sections
+        self.vocab_start = start
+
+    def word(self, id):
+        """
+            returns UTF-8 bytes of word with the given id
+        """
+        return self.data[self.vocab_start + self.offsets[id]:self.vocab_start + self.offsets[id + 1]]
+
+    def word_id(self, word):
+        """
+            returns id of word, or None if it is not in the vocab
+        """
+        target = word.encode()
+        low, high = 0, self.num_words
+        while low < high:
+            mid = (low + high) // 2
+            if self.word(mid) < target: low = mid + 1
+            else: high = mid
+        if low < self.num_words and self.word(low) == target: return low
+        return None
+
+    def __getitem__(self, bigram):
+        pair = bigram.split(" ", 1)
+        if len(pair) == 2:
+            first, second = self.word_id(pair[0]), self.word_id(pair[1])
+            if first is not None and second is not None:
+                key = (first << 32) | second
+                i = bisect.bisect_left(self.keys, key)
+                if i < self.num_bigrams and self.keys[i] == key:
+                    return self.counts[i]
+        raise KeyError(bigram)
+
+    def get(self, bigram, default=None):
+        try:
+            return self[bigram]
+        except KeyError:
+            return default
+
+    def __contains__(self, bigram):
+        return self.get(bigram) is not None
+
+    def __len__(self):
+        return self.num_bigrams
+
+    def items(self):
+        """
+            Iterate over bigrams in the store and their counts.
+        """
+        for key, count in zip(self.keys, self.counts):
+            yield (self.word(key >> 32).decode() + " " + self.word(key & 0xffffffff).decode(), count)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# compare_tokenizers.py
+#
+# Compare the regular expression tokenizer in fast_tokenize.py with NLTK's
+# word_tokenize on a corpus: how often they agree, where they disagree, and
+# how fast each one is.
+#
+###############################################################################
+
+import sys, argparse, time, difflib, collections
+from nltk.tokenize import word_tokenize
+import fast_tokenize
+sys.path.append('../')
+from utils import *
+
+# Cases the tokenizers have disagreed on, compared with --examples
+examples = ["Q. Did you see him take it? A. Yes, I did.",
+            "Q. What did he say? A. He said 'won't' and went away.",
+            "'won't' he said, 'I'll go.'",
+            "John A. Smith, Esq. lodged at No. 4, St. Paul's.",
+            "I cannot go; 'cannot' he said. 'Tis done.",
+            "He said \"I don't know\" and ''won't'' say.",
+            "He paid 1,000 more -- at 10:30... and left."]
+
+def read_texts(args):
+    """
+        Read the text of each document in args.tsv_corpus, or of each file in
+        args.files.
+
+        returns list of texts
+    """
+    texts = []
+    if args.tsv_corpus:
+        with open_file(args.tsv_corpus) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t", 2)
+                if len(parts) < 3 or line.lower().startswith("id\tyear\ttext"): continue
+                texts.append(parts[2])
+                if args.max_docs and len(texts) >= args.max_docs: break
+    else:
+        for file in args.files[:args.max_docs or None]:
+            with open_file(file) as f:
+                texts.append(f.read())
+    return texts
+
+def time_tokenizer(tokenize, texts):
+    """
+        Tokenize every text.
+
+        returns list of token lists and time taken in seconds
+    """
+    start = time.perf_counter()
+    tokens = [tokenize(text) for text in texts]
+    return tokens, time.perf_counter() - start
+
+def agreement(nltk_tokens, fast_tokens, differences):
+    """
+        Count the tokens two tokenizations of the same text have in common (in
+        order), adding each stretch where they differ to differences.
+
+        input:
+            nltk_tokens (list): tokens from word_tokenize
+            fast_tokens (list): tokens from fast_tokenize.word_tokenize
+            differences (Counter): counts of (nltk tokens, fast tokens) pairs
+
+        returns number of matching tokens
+    """
+    if nltk_tokens == fast_tokens: return len(nltk_tokens)
+    matcher = difflib.SequenceMatcher(None, nltk_tokens, fast_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            differences[(" ".join(nltk_tokens[i1:i2]), " ".join(fast_tokens[j1:j2]))] += 1
+    return sum(block.size for block in matcher.get_matching_blocks())
+
+def compare_examples():
+    """
+        Tokenize each of the examples with both tokenizers and print the
+        tokens of any the tokenizers disagree on.
+    """
+    same = 0
+    for text in examples:
+        nltk_tokens, fast_tokens = word_tokenize(text), fast_tokenize.word_tokenize(text)
+        if nltk_tokens == fast_tokens:
+            same += 1
+            continue
+        print(text + "\nnltk\t" + " ".join(nltk_tokens) + "\nfast\t" + " ".join(fast_tokens) + "\n")
+    print("identical examples\t" + str(same) + "/" + str(len(examples)))
+
+def main(args):
+    if args.examples:
+        compare_examples()
+        if not args.files and not args.tsv_corpus: return
+    print(timestamp(), "Reading documents...", file=sys.stderr)
+    texts = read_texts(args)
+    size = sum(len(text) for text in texts)
+    print(timestamp(), "Tokenizing", len(texts), "documents (" + str(round(size / 2**20, 1)) + " MB)...", file=sys.stderr)
+
+    nltk_docs, nltk_time = time_tokenizer(word_tokenize, texts)
+    fast_docs, fast_time = time_tokenizer(fast_tokenize.word_tokenize, texts)
+
+    differences = collections.Counter()
+    matched = same_docs = 0
+    for nltk_tokens, fast_tokens in zip(nltk_docs, fast_docs):
+        matched += agreement(nltk_tokens, fast_tokens, differences)
+        same_docs += nltk_tokens == fast_tokens
+    nltk_count = sum(len(tokens) for tokens in nltk_docs)
+    fast_count = sum(len(tokens) for tokens in fast_docs)
+
+    print("tokenizer\ttokens\tseconds\ttokens_per_second\tmb_per_second")
+    for name, count, seconds in [("nltk", nltk_count, nltk_time), ("fast", fast_count, fast_time)]:
+        print("\t".join([name, str(count), str(round(seconds, 2)),
+                         str(round(count / seconds)), str(round(size / 2**20 / seconds, 2))]))
+    print("speedup\t" + str(round(nltk_time / fast_time, 2)))
+    print("identical documents\t" + str(same_docs) + "/" + str(len(texts)))
+    print("token agreement\t" + str(round(matched / max(nltk_count, fast_count, 1), 5)))
+
+    if differences:
+        print("\nnltk\tfast\tcount")
+        for (nltk_str, fast_str), count in differences.most_common(args.show):
+            print(nltk_str + "\t" + fast_str + "\t" + str(count))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='text files to tokenize (if no tsv file is given)')
+    parser.add_argument('--tsv_corpus', type=str, default="", help='path to data in tsv format')
+    parser.add_argument('--max_docs', type=int, default=0, help='number of documents to compare (default all)')
+    parser.add_argument('--examples', default=False, action="store_true", help='whether or not to also compare the tokenizers on examples of hard cases (e.g., "Q." and "A.", quoted contractions)')
+    parser.add_argument('--show', type=int, default=20, help='number of most common differences to print')
+    args = parser.parse_args()
+    main(args)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import sys, html, re, os, argparse, natsort
+import sys, re, os, argparse, natsort, functools, multiprocessing, json
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
 from tqdm import tqdm
 from tei_reader import TeiReader
@@ -13,191 +14,574 @@ type_dict = {
     ("div0", "ordinarysAccount"): (2,6)
 }
 
-def encode_name(args, elem):
+def name_info(elem):
     """
-        Encode name information based on a given element with tag "persName"
+        Collect name information from an element with tag "persName" and its
+        subelements.
 
-        args: arguments from the command line
         elem: an ElementTree.Element object
 
-        returns information to replace name with.
+        returns dictionary with the speaker type, gender, given name and surname,
+        and whether the gender and name are known
     """
     base = elem.tag[:-4] if not "type" in elem.attrib else elem.attrib["type"][:-4]
-    added_info = []
+    info = {"type": base, "gender": [], "given": [], "surname": [],
+            "gender_known": True, "name_known": True}
 
     # Iterate over subelements.
     for sub_elem in elem.iter():
-        # For a specific annotation, encode in format speakerType_GIVEN_SURNAME
-        if args.encode_annotations_specific:
-            try:
-                if sub_elem.attrib['type'] == 'surname':
-                    surname = sub_elem.attrib["value"].split(" ")
-                    added_info.append("_".join(surname))
-                elif sub_elem.attrib['type'] == 'given':
-                    given = sub_elem.attrib["value"].split(" ")
-                    added_info = ["_".join(given)] + added_info
-
-            # If name is not known, encode in format speakerType_unk
-            except KeyError:
-                return "$" + base + "_unk "
-        # For a general annotation, encode in format speakerType_gender
-        else:
-            try:
-                if sub_elem.attrib['type'] == 'gender':
-                    gender = sub_elem.attrib["value"]
-                    if gender == "indeterminate":
-                        gender = "unk"
-                    added_info.append(gender)
-            # If gender is not known, encode in format speakerType_unk
-            except KeyError:
-                return "$" + base + "_unk "
+        # If type of a subelement is not known, neither name nor gender is
+        if not "type" in sub_elem.attrib:
+            info["gender_known"] = info["name_known"] = False
+            break
+        type = sub_elem.attrib["type"]
+        if type in ["surname", "given"]:
+            if not "value" in sub_elem.attrib:
+                info["name_known"] = False
+            elif info["name_known"]:
+                info[type].append("_".join(sub_elem.attrib["value"].split(" ")))
+        elif type == "gender":
+            if not "value" in sub_elem.attrib:
+                info["gender_known"] = False
+            elif info["gender_known"]:
+                gender = sub_elem.attrib["value"]
+                info["gender"].append("unk" if gender == "indeterminate" else gender)
+
+    info["gender"] = "_".join(info["gender"])
+    # Given names are written before surnames, last given name first
+    info["given"] = "_".join(info["given"][::-1])
+    info["surname"] = "_".join(info["surname"])
+    return info
+
+def format_name(args, info):
+    """
+        Encode name information returned by name_info.
 
+        args: arguments from the command line
+        info: dictionary of name information
 
-    return "$" + "_".join([base, "_".join(added_info)]) + " "
+        returns information to replace name with.
+    """
+    # For a specific annotation, encode in format speakerType_GIVEN_SURNAME
+    if args.encode_annotations_specific:
+        known = info["name_known"]
+        added_info = [name for name in [info["given"], info["surname"]] if name]
+    # For a general annotation, encode in format speakerType_gender
+    else:
+        known = info["gender_known"]
+        added_info = [info["gender"]]
 
+    # If name or gender is not known, encode in format speakerType_unk
+    if not known:
+        return "$" + info["type"] + "_unk "
+    return "$" + "_".join([info["type"], "_".join(added_info)]) + " "
 
-def encode_annotations(args, xml_path, txt_output_dir):
+def encode_name(args, elem):
     """
-        Replace parts of text file with relevant annotations (as provided on command line?)
+        Encode name information based on a given element with tag "persName"
 
         args: arguments from the command line
+        elem: an ElementTree.Element object
+
+        returns information to replace name with.
+    """
+    return format_name(args, name_info(elem))
+
+
+def london_lives_date(xml_path, elem):
+    """
+        Read the date of a London Lives document from the first element with
+        tag "date" after its "elementDate" element.
+
         xml_path: path to XML file
+        elem: an ElementTree.Element object with tag "date"
 
-        Returns string of content of xml_path file with modified annotations (if needed)
+        returns id of document, year, and list of date parts
+    """
+    # Get the date, format is DD.MM.YYYY
+    date = re.split("[./]", elem.attrib["modern"].rstrip())
+    id = os.path.splitext(os.path.basename(xml_path))[0]
+    if not date[-1]: year = date[-2]
+    else: year = date[-1]
+    return id, year, date
+
+def read_london_lives_date(xml_path):
+    """
+        Find the date of a London Lives document, parsing only as far as the
+        date (at the start of the file) instead of the whole file.
+
+        returns (id, year) or None if the document has no date
     """
-    annotations = ["persName"] # Fix this to take in as an argument
     ready_for_date = False
-    skip = True
-    # Define XML tree from xmlFile
-    xml_tree = ET.parse(xml_path)
-    root = xml_tree.getroot()
-    for elem in root.iter():
-        # Additional work needed to process london lives corpus
-        if args.london_lives:
-            # Extract date
-            if elem.tag == "elementDate":
-                ready_for_date = True
-            elif ready_for_date and elem.tag == "date":
-                # Get the date, format is DD.MM.YYYY
-                date = re.split("[./]", elem.attrib["modern"].rstrip())
-                # Create filename from date to make later processing easier
-                id = os.path.splitext(os.path.basename(xml_path))[0]
-                if args.tsv:
-                    if not date[-1]: year = date[-2]
-                    else: year = date[-1]
-
-                    filename = id + "\t" + year + "\t"
-                else:
-                    filename = "".join(date[::-1]) + "_" + id + ".txt"
-
-                ready_for_date = False
-            # Don't include ID numbers within document
-            elif elem.tag == "img":
-                skip = False
-                elem.text = None
-            elif skip:
-                elem.text = " "
-                continue
-            elem.text = " " if not elem.text else elem.text + " "
+    try:
+        with open(xml_path, "rb") as f:
+            for _, elem in ET.iterparse(f, events=("start",)):
+                if elem.tag == "elementDate":
+                    ready_for_date = True
+                elif ready_for_date and elem.tag == "date":
+                    return london_lives_date(xml_path, elem)[:2]
+    except (ET.ParseError, KeyError, IndexError, UnicodeDecodeError):
+        pass
+    return None
+
+def scan_dir(path):
+    """
+        List the subdirectories and files of a directory with os.scandir.
 
-        # Replace relevant pieces of text with annotations if necessary
-        if args.encode_annotations_general or args.encode_annotations_specific:
-            if elem.tag in annotations:
-                if elem.tag == "persName":
-                    # Get information from subelements
-                    annotated_element = encode_name(args, elem)
-                else: # Implement other annotations here
-                    annotated_element = ""
-                # Replace info in element with new info
-                elem.clear()
-                elem.text = annotated_element
-        if not args.london_lives and args.tsv or args.split_trials:
+        returns list of paths of subdirectories and list of filenames
+    """
+    dirs, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
             try:
-            # Check if current element indicates a split between trials
-                if elem.tag in type_dict:
-                    range = type_dict[elem.tag]
-                elif (elem.tag, elem.attrib["type"]) in type_dict:
-                    range = type_dict[elem.tag, elem.attrib["type"]]
-                else:
-                    # Does not indicate a split between trials
-                    elem.text = " " if not elem.text else elem.text + " "
-                    continue
-
-                # If splitting by trial and have identified a new trial, indicate
-                # with string 'SPLIT_HERE'
-                if args.split_trials:
-                    # Identify file name and insert text
-                    file_name = elem.attrib["id"]
-                    elem.text = "SPLIT_HERE" + file_name[range[0]:range[1]] + "SPLIT_HERE" + file_name
-                else: elem.text = " " if not elem.text else elem.text + " "
-            # Element doesn't contain the right attributes
-            except KeyError:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            # Like os.walk, list symbolic links to directories but don't enter them
+            if is_dir and not entry.is_symlink(): dirs.append(entry.path)
+            elif not is_dir: files.append(entry.name)
+    return dirs, files
+
+def find_london_lives(corpus_dir, threads):
+    """
+        Find all XML files under corpus_dir, scanning the directories of each
+        level of the tree in parallel. Files are listed in the same order as
+        os.walk(corpus_dir, topdown=False) would list them.
+
+        corpus_dir: directory containing London Lives XML files
+        threads: number of threads to scan directories with
+
+        returns list of paths to XML files
+    """
+    scanned = {}
+    level = [corpus_dir]
+    with ThreadPoolExecutor(threads) as executor:
+        while level:
+            results = list(executor.map(scan_dir, level))
+            scanned.update(zip(level, results))
+            level = [d for dirs, _ in results for d in dirs]
+
+    def walk(path):
+        dirs, files = scanned[path]
+        output = []
+        for dir in dirs:
+            output += walk(dir)
+        return output + [os.path.join(path, f) for f in files if f[-4:] == ".xml"]
+    return walk(corpus_dir)
+
+def index_london_lives(args, input_files):
+    """
+        Find the id and year of every London Lives document in parallel and
+        write them to an index next to the corpus directory, which
+        utils.order_files can use to split London Lives tsv files by year.
+
+        args: arguments from the command line
+        input_files: list of paths to XML files
+
+        returns list of input files that have a date
+    """
+    with ThreadPoolExecutor(args.scan_threads) as executor:
+        dates = list(executor.map(read_london_lives_date, input_files))
+
+    index_path = os.path.dirname(args.corpus_XML_dir).rstrip("/") + "-index.tsv"
+    dated = []
+    with open(index_path, "w") as f:
+        f.write("id\tyear\tpath")
+        for file, date in zip(input_files, dates):
+            if date is None:
+                print("No date found in " + file + ". Skipping...", file=sys.stderr)
+                continue
+            f.write("\n" + "\t".join([date[0], date[1],
+                                      os.path.relpath(file, args.corpus_XML_dir)]))
+            dated.append(file)
+    print(timestamp(), "Index of", len(dated), "documents written to", index_path, file=sys.stderr)
+    return dated
+
+def encode_element(args, elem, state):
+    """
+        Modify the text of one element in place based on its tag and the
+        elements seen before it (in document order).
+
+        args: arguments from the command line
+        elem: an ElementTree.Element object
+        state: dictionary carrying information between elements (path of the
+            XML file, London Lives date flags, output filename, id and year of
+            a trial starting at this element)
+    """
+    annotations = ["persName"] # Fix this to take in as an argument
+    # Additional work needed to process london lives corpus
+    if args.london_lives:
+        # Extract date
+        if elem.tag == "elementDate":
+            state["ready_for_date"] = True
+        elif state["ready_for_date"] and elem.tag == "date":
+            id, year, date = london_lives_date(state["xml_path"], elem)
+            state["id"], state["year"] = id, year
+            # Create filename from date to make later processing easier
+            if args.tsv:
+                state["filename"] = id + "\t" + year + "\t"
+            else:
+                state["filename"] = "".join(date[::-1]) + "_" + id + ".txt"
+
+            state["ready_for_date"] = False
+        # Don't include ID numbers within document
+        elif elem.tag == "img":
+            state["skip"] = False
+            elem.text = None
+        elif state["skip"]:
+            elem.text = " "
+            return
+        elem.text = " " if not elem.text else elem.text + " "
+
+    # Replace relevant pieces of text with annotations if necessary
+    if args.encode_annotations_general or args.encode_annotations_specific:
+        if elem.tag in annotations:
+            if elem.tag == "persName":
+                # Get information from subelements
+                annotated_element = encode_name(args, elem)
+            else: # Implement other annotations here
+                annotated_element = ""
+            # Replace info in element with new info
+            elem.clear()
+            elem.text = annotated_element
+    if not args.london_lives and args.tsv or args.split_trials:
+        try:
+        # Check if current element indicates a split between trials
+            if elem.tag in type_dict:
+                range = type_dict[elem.tag]
+            elif (elem.tag, elem.attrib["type"]) in type_dict:
+                range = type_dict[elem.tag, elem.attrib["type"]]
+            else:
+                # Does not indicate a split between trials
                 elem.text = " " if not elem.text else elem.text + " "
-        else:
+                return
+
+            # If splitting by trial and have identified a new trial, record
+            # its id and year so the trial can be started here
+            if args.split_trials:
+                file_name = elem.attrib["id"]
+                state["trial"] = (file_name, file_name[range[0]:range[1]])
+                elem.text = None
+            else: elem.text = " " if not elem.text else elem.text + " "
+        # Element doesn't contain the right attributes
+        except KeyError:
             elem.text = " " if not elem.text else elem.text + " "
+    else:
+        elem.text = " " if not elem.text else elem.text + " "
 
+def is_annotated(args, elem, state):
+    """
+        Determine if encode_element will replace an element (and everything
+        inside of it) with an annotation.
+    """
+    if not (args.encode_annotations_general or args.encode_annotations_specific):
+        return False
+    if args.london_lives and state["skip"]:
+        return False
+    return elem.tag == "persName"
+
+def is_indexed(args, elem, state):
+    """
+        Determine if an element is a name that should be recorded in the name
+        index (see name_rows).
+    """
+    if not getattr(args, "name_index", False):
+        return False
+    if args.london_lives and state["skip"]:
+        return False
+    return elem.tag == "persName"
+
+def stream_text(args, xml_path, state):
+    """
+        Parse an XML file incrementally, encoding elements as they are read
+        and yielding the same text as tree_text would for the fully parsed
+        tree.
 
-    # Find root of tree, convert to string, and return
-    text_from_xml = str(ET.tostring(root, encoding='ASCII', method='text'))
-    # Fix issues with new lines and tabs
-    # sub_str = " " if args.tsv else "\n"
-    text_from_xml = html.unescape(text_from_xml).replace("\\t", " ").replace("\\n", "\n")
-    if args.london_lives and args.tsv: text_from_xml = text_from_xml.replace("\\n", "\n")
-    text_from_xml = re.sub("\ +", " ", text_from_xml)
+        Each element is encoded once its own text is available, which keeps the
+        order elements are encoded in the same as iterating over the whole tree.
+        Elements are removed from their parent as soon as their tail has been
+        yielded, so memory use does not grow with the size of the file.
+
+        args: arguments from the command line
+        xml_path: path to XML file
+        state: dictionary passed to encode_element
+
+        yields pieces of text in document order, a ("trial", id, year) tuple
+        where each trial starts if splitting by trial, and ("name",) and
+        ("/name", info) tuples around each name if args.name_index is set
+    """
+    parents = []
+    # Element whose text is not known yet
+    pending = None
+    # Most recently closed element, whose tail is not known yet
+    last = None
+    keep_tail = True
+    # Annotated element, kept whole until it closes so encode_name can read it
+    held = None
+    # Names being indexed that are open, kept whole until their tail has been
+    # yielded so name_info can read them
+    names = []
+
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if held is not None and elem is not held:
+            continue
+
+        # Text between the previous tag and this one is now complete
+        if pending is not None:
+            encode_element(args, pending, state)
+            if "trial" in state: yield ("trial",) + state.pop("trial")
+            if names and names[-1] is pending: yield ("name",)
+            if pending.text: yield pending.text
+            pending = None
+        elif last is not None:
+            if keep_tail and last.tail: yield last.tail
+            if names and names[-1] is last:
+                yield ("/name", name_info(names.pop()))
+            if not names: parents[-1].remove(last)
+            last = None
+
+        if event == "start":
+            if is_annotated(args, elem, state): held = elem
+            else:
+                pending = elem
+                if is_indexed(args, elem, state): names.append(elem)
+            parents.append(elem)
+        else:
+            if held is not None:
+                # Annotation replaces the element, its children, and its tail
+                encode_element(args, held, state)
+                if held.text: yield held.text
+                held = None
+                keep_tail = False
+            else:
+                keep_tail = True
+            last = parents.pop()
+
+    if last is not None and keep_tail and last.tail:
+        yield last.tail
+    if names: yield ("/name", name_info(names.pop()))
+
+def tree_text(args, elem, state):
+    """
+        Encode an element and everything inside of it, yielding text in
+        document order (the element's text, then the text of each child
+        followed by the child's tail).
+
+        args: arguments from the command line
+        elem: an ElementTree.Element object
+        state: dictionary passed to encode_element
+
+        yields pieces of text in document order (see stream_text)
+    """
+    encode_element(args, elem, state)
+    if "trial" in state: yield ("trial",) + state.pop("trial")
+    if elem.text: yield elem.text
+    for child in elem:
+        indexed = is_indexed(args, child, state)
+        if indexed: yield ("name",)
+        yield from tree_text(args, child, state)
+        if child.tail: yield child.tail
+        if indexed: yield ("/name", name_info(child))
+
+space_re = re.compile(" {2,}")
+
+# Tabs and characters other than "\n" that text readers treat as line breaks
+# (e.g., from a "&#13;" entity), which would split a tsv line
+break_re = re.compile("[\t\r\x0b\x0c]")
+break_table = str.maketrans("\t\r\x0b\x0c", "    ")
+
+def assemble_text(pieces):
+    """
+        Join pieces of text, replacing tabs, carriage returns, vertical tabs
+        and form feeds with spaces and collapsing runs of spaces as each piece
+        is added.
+
+        pieces: iterable of strings
+
+        returns joined text
+    """
+    text = []
+    space = False
+    for piece in pieces:
+        # Most pieces are the single spaces added after each element
+        if piece == " ":
+            if not space:
+                text.append(piece)
+                space = True
+            continue
+        if break_re.search(piece): piece = piece.translate(break_table)
+        if "  " in piece: piece = space_re.sub(" ", piece)
+        if space and piece[0] == " ":
+            piece = piece[1:]
+            if not piece: continue
+        text.append(piece)
+        space = piece[-1] == " "
+    return "".join(text)
+
+def xml_pieces(args, xml_path, state):
+    """
+        Encode an XML file, parsing it incrementally if args.stream is set.
+
+        returns generator of pieces of text (see tree_text)
+    """
+    if args.stream:
+        # Encode and collect text while parsing instead of building the tree
+        return stream_text(args, xml_path, state)
+    # Define XML tree from xmlFile
+    root = ET.parse(xml_path).getroot()
+    return tree_text(args, root, state)
+
+def encode_annotations(args, xml_path, txt_output_dir):
+    """
+        Replace parts of text file with relevant annotations (as provided on command line?)
+
+        args: arguments from the command line
+        xml_path: path to XML file
+
+        Returns string of content of xml_path file with modified annotations (if needed)
+    """
+    state = {"xml_path": xml_path, "ready_for_date": False, "skip": True}
+    text_from_xml = assemble_text(xml_pieces(args, xml_path, state))
 
     if args.london_lives:
-        return text_from_xml, filename
+        return text_from_xml, state["filename"]
     return text_from_xml
 
-def split_trials(text, split_trials=False, tsv=False, file=""):
+def join_trial(pieces, join_str):
+    """
+        Assemble the text of one trial, dropping empty lines and joining the
+        rest with join_str.
     """
-        Iterate over text found from file. Find indication of split between
-        trials ("SPLIT_HERE\tYEAR\tID"). Return list of lines to be written to
-        tsv file where each line is ID\tYEAR\tTEXT.
+    lines = [line for line in assemble_text(pieces).split("\n") if line.strip()]
+    return space_re.sub(" ", join_str.join(lines))
+
+def name_rows(pieces, pipes=False):
     """
-    if tsv: join_str = " "
-    else: join_str = "\n"
+        Find where each name is in the text of a document, counting tokens
+        (separated by whitespace) in the pieces before and inside each pair of
+        ("name",) and ("/name", info) markers. A name covers its text and its
+        tail, which is the text an annotation replaces.
 
-    # Splitting by session, don't need to find different trials within file.
-    # Just return text itself
-    if not split_trials:
-        text = re.sub("[\ |\t]+", " ", text)
-        # If tsv, must remove all line breaks and format in tsv format
-        if tsv and file:
-            text = " ".join(text.split("\n"))
-            id = os.path.basename(file).split(".")[0]
-            year = str(get_year(file))
-            text = id + "\t" + year + "\t" + text
-        return [text]
+        pieces: list of pieces of text and name markers for one document
+        pipes: whether or not "|" will be replaced with a space in the text
 
-    lines = text.split("\n")
+        returns list of pieces of text without markers and list of
+        (offset, length, info) for each name
+    """
     text = []
-    tsv_out = []
-    # Iterate over lines in text
-    for line in lines:
-        # If found trial split
-        if "SPLIT_HERE" in line:
-            # If text contains lines, i.e., not an empty trial
-            if text:
-                # Replace extra spacing
-                merged_text = re.sub("\ +", " ", join_str.join(text))
-                # Join text with id and year
-                tsv_out.append(id + "\t" + year + "\t" + merged_text)
-                # Reset text
-                text = []
-            # Get new year and id from current line which refers to subsequent trial
-            _, year, id = line.split("SPLIT_HERE")
-            id = id.rstrip()
-        # Otherwise, just add line to text
-        elif line.strip():
-            text.append(line)
-
-    # If anything is leftover, process in the same way
-    if text:
-        merged_text = re.sub("\ +", " ", join_str.join(text))
-        tsv_out.append(id + "\t" + year + "\t" + merged_text)
-    # Return list of lines making up tsv file
-    return tsv_out
+    rows = []
+    starts = []
+    count = 0
+    # Whether the last piece ended inside a token
+    in_token = False
+    for piece in pieces:
+        if type(piece) is tuple:
+            if piece[0] == "name":
+                starts.append(count)
+            else:
+                start = starts.pop()
+                rows.append((start, count - start, piece[1]))
+            continue
+        text.append(piece)
+        if not piece: continue
+        if pipes: piece = piece.replace("|", " ")
+        n = len(piece.split())
+        # A token continuing from the last piece was already counted
+        if n and in_token and not piece[0].isspace(): n -= 1
+        count += n
+        in_token = not piece[-1].isspace()
+    return text, rows
+
+def iter_trials(args, xml_path, names=None):
+    """
+        Convert an XML file, yielding each trial (or other section starting at
+        an element in type_dict) as soon as the next one starts. Trials with no
+        text are skipped.
+
+        args: arguments from the command line (args.split_trials must be set)
+        xml_path: path to XML file
+        names: list to add (id, offset, length, info) to for each name in a
+            trial if args.name_index is set
+
+        yields (id, year, text) for each trial, text is on one line if args.tsv
+    """
+    join_str = " " if args.tsv else "\n"
+    state = {"xml_path": xml_path, "ready_for_date": False, "skip": True}
+    id = None
+    pieces = []
+    for piece in xml_pieces(args, xml_path, state):
+        if type(piece) is not tuple or piece[0] != "trial":
+            pieces.append(piece)
+            continue
+        # Text before the first trial has no id and is dropped
+        if id is not None:
+            yield from finish_trial(id, year, pieces, join_str, names)
+        _, id, year = piece
+        pieces = []
+    if id is not None:
+        yield from finish_trial(id, year, pieces, join_str, names)
+
+def finish_trial(id, year, pieces, join_str, names):
+    """
+        Assemble the text of one trial and record where its names are.
+
+        yields (id, year, text) if the trial has text
+    """
+    if names is not None:
+        pieces, rows = name_rows(pieces)
+    text = join_trial(pieces, join_str)
+    if not text: return
+    if names is not None:
+        names += [(id,) + row for row in rows]
+    yield id, year, text
+
+def format_document(text, tsv=False):
+    """
+        Clean up spacing in the text of a whole session or Ordinary's account,
+        putting it on one line if writing a tsv file.
+    """
+    text = re.sub("[\ |\t]+", " ", text)
+    # If tsv, must remove all line breaks
+    if tsv:
+        text = " ".join(text.split("\n"))
+    return text
+
+def iter_documents(args, xml_path, names=None):
+    """
+        Convert an XML file, yielding each document in it: every trial if
+        args.split_trials is set, otherwise the whole file. This can be used to
+        read the corpus straight from XML without writing a tsv file, e.g.:
+
+            for file in input_files:
+                for id, year, text in iter_documents(args, file): ...
+
+        args: arguments from the command line
+        xml_path: path to XML file
+        names: list to add (id, offset, length, info) to for each name in a
+            document if args.name_index is set
+
+        yields (id, year, text) for each document, text is on one line if
+        args.tsv is set
+    """
+    if args.split_trials and not args.london_lives:
+        yield from iter_trials(args, xml_path, names)
+        return
+
+    state = {"xml_path": xml_path, "ready_for_date": False, "skip": True}
+    pieces = xml_pieces(args, xml_path, state)
+    if names is not None:
+        # format_document replaces "|" with a space
+        pieces, rows = name_rows(pieces, pipes=not args.london_lives)
+    text = assemble_text(pieces)
+    if args.london_lives:
+        if args.tsv: text = text.replace("\n", " ")
+        id, year = state["id"], state["year"]
+    else:
+        text = format_document(text, tsv=args.tsv)
+        id, year = os.path.basename(xml_path).split(".")[0], str(get_year(xml_path))
+    if names is not None:
+        names += [(id,) + row for row in rows]
+    yield id, year, text
 
 def write_file(args, txt_output_dir, name, text):
     """
@@ -216,95 +600,396 @@ def write_file(args, txt_output_dir, name, text):
     with open(path, "w") as file:
         file.write(text)
 
+def write_lines(args, path, header, lines):
+    """
+        Function to write a header and lines to a tsv file, one line at a time
+    """
+    # If file exists and don't want to overwrite, don't write to file
+    if os.path.exists(path) and not args.overwrite:
+        return
+
+    # File is compressed if path ends in ".gz" or ".xz"
+    with open_file(path, "w") as file:
+        file.write(header)
+        for line in lines:
+            file.write("\n" + line)
+
+def convert_file(args, file, txt_output_dir):
+    """
+        Convert one XML file to text. Text files are written directly, lines
+        for a tsv file are returned.
+
+        args: arguments from the command line
+        file: path to XML file
+        txt_output_dir: directory to write text files to
+
+        returns list of tsv lines (empty if not writing a tsv file) and list of
+        name index rows (empty if args.name_index is not set)
+    """
+    # Change to txt file
+    if not args.london_lives and not args.tsv:
+        filename = os.path.splitext(os.path.basename(file))[0] + ".txt"
+        file_path = os.path.join(txt_output_dir, filename)
+        if os.path.exists(file_path) and not args.overwrite:
+            return [], []
+    names = [] if getattr(args, "name_index", False) else None
+    # Write text to txt file
+    try:
+        # If working with tsv file, return tsv output
+        if args.tsv:
+            lines = [id + "\t" + year + "\t" + text
+                     for id, year, text in iter_documents(args, file, names)]
+            return lines, [name_line(row) for row in names or []]
+        # London lives
+        elif args.london_lives:
+            text_from_xml, filename = encode_annotations(args, file, txt_output_dir)
+            # Write data to file
+            write_file(args, txt_output_dir, filename, text_from_xml)
+        # If not doing tsv file but still want to split trials
+        elif args.split_trials:
+            # Iterate over every trial and write to text file
+            for id, year, text in iter_documents(args, file):
+                # Filename is based on trial ID
+                write_file(args, txt_output_dir, id + ".txt", id + "\t" + year + "\t" + text)
+        # Otherwise, just write entire session to file
+        else:
+            filename = os.path.splitext(os.path.basename(file))[0] + ".txt"
+            write_file(args, txt_output_dir, filename, next(iter_documents(args, file))[2])
+    # Catch possible errors
+    except UnicodeDecodeError:
+        print("UnicodeDecodeError reading " + file + ". Skipping...")
+    except ET.ParseError:
+        print("ParseError reading " + file + ". Skipping...")
+    return [], []
+
+name_header = "id\toffset\tlength\ttype\tgender\tgiven\tsurname\tgender_known\tname_known"
+
+def name_line(row):
+    """
+        Format an (id, offset, length, info) row as a line of the name index.
+    """
+    id, offset, length, info = row
+    return "\t".join([id, str(offset), str(length), info["type"], info["gender"],
+                      info["given"], info["surname"], str(int(info["gender_known"])),
+                      str(int(info["name_known"]))])
+
+def read_name_line(line):
+    """
+        Read a line of the name index (without its id column).
+
+        returns (offset, length, info) where info is as returned by name_info
+    """
+    offset, length, type, gender, given, surname, gender_known, name_known = line.split("\t")
+    info = {"type": type, "gender": gender, "given": given, "surname": surname,
+            "gender_known": gender_known == "1", "name_known": name_known == "1"}
+    return int(offset), int(length), info
+
+def load_name_index(names_path):
+    """
+        Load a name index written by data_reader.py --name_index.
+
+        returns dictionary of {id: [line, ...]} where lines are unparsed and
+        don't include the id
+    """
+    names = {}
+    with open(names_path, "r") as f:
+        next(f)
+        for line in f:
+            id, row = line.rstrip("\n").split("\t", 1)
+            names.setdefault(id, []).append(row)
+    return names
+
+def apply_names(args, text, lines):
+    """
+        Replace the names in one document of plain text with annotations.
+
+        args: arguments from the command line
+        text: plain text of the document
+        lines: lines of the name index for the document
+
+        returns annotated text, with tokens separated by single spaces
+    """
+    tokens = text.split()
+    # Sort names so a name comes before the names inside of it
+    rows = sorted((read_name_line(line) for line in lines),
+                  key=lambda row: (row[0], -row[1]))
+    output = []
+    pos = 0
+    for offset, length, info in rows:
+        # Name is inside of a name that was already replaced
+        if offset < pos: continue
+        output += tokens[pos:offset]
+        output.append(format_name(args, info).strip())
+        pos = offset + length
+    output += tokens[pos:]
+    return " ".join(output)
+
+def regenerate_annotations(args, text_path, names_path, output_path):
+    """
+        Write an annotated version of a plain tsv file using its name index,
+        without reading the XML files again.
+
+        args: arguments from the command line
+        text_path: path to plain tsv file
+        names_path: path to name index of text_path
+        output_path: path to write annotated tsv file to
+    """
+    names = load_name_index(names_path)
+    def annotated_lines(f):
+        for line in f:
+            id, year, text = line.rstrip("\n").split("\t", 2)
+            if id in names: text = apply_names(args, text, names[id])
+            yield id + "\t" + year + "\t" + text
+
+    with open_file(text_path, "r") as f:
+        header = next(f).rstrip("\n")
+        write_lines(args, output_path, header, annotated_lines(f))
+
+def manifest_flags(args):
+    """
+        Return the command line flags that change the converted output. A
+        manifest written with different flags can't be reused.
+    """
+    return {"version": 3,
+            "split_trials": args.split_trials,
+            "encode_annotations_general": args.encode_annotations_general,
+            "encode_annotations_specific": args.encode_annotations_specific,
+            "london_lives": args.london_lives,
+            "tsv": args.tsv,
+            "name_index": args.name_index}
+
+def load_manifest(args, manifest_path):
+    """
+        Load the manifest from a previous conversion if it can be reused.
+
+        returns dictionary of {relative XML path: entry}, empty if there is no
+        usable manifest
+    """
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("flags") != manifest_flags(args):
+        print("Flags differ from those in " + manifest_path + ". Converting all files...", file=sys.stderr)
+        return {}
+    return manifest["files"]
+
+def check_manifest(args, input_files, old_entries):
+    """
+        Compare input files against the entries of a previous manifest. A file
+        is unchanged if its size and mtime match, or if its size and content
+        hash match. Files are only hashed if args.incremental is set.
+
+        returns new manifest entries for all input files and list of files that
+        need to be converted
+    """
+    entries = {}
+    to_convert = []
+    for file in input_files:
+        rel = os.path.relpath(file, args.corpus_XML_dir)
+        stat = os.stat(file)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+        old = old_entries.get(rel)
+        if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+            entry["sha1"] = old.get("sha1")
+        else:
+            entry["sha1"] = file_hash(file) if args.incremental else None
+        if old and old.get("sha1") == entry["sha1"] and old["size"] == entry["size"]:
+            entry["ids"] = old["ids"]
+        else:
+            to_convert.append(file)
+        entries[rel] = entry
+    return entries, to_convert
+
+def copy_names(names_path, names_file, converted, entries, corpus_dir):
+    """
+        Copy the rows of an existing name index that came from XML files that
+        were not converted again.
+
+        names_path: path to existing name index
+        names_file: open file to write rows to
+        converted: set of XML files being converted
+        entries: manifest entries for all input files
+        corpus_dir: directory containing XML files
+    """
+    ids = set()
+    for rel, entry in entries.items():
+        if os.path.join(corpus_dir, rel) not in converted:
+            ids.update(entry["ids"])
+    try:
+        with open(names_path, "r") as f:
+            next(f)
+            for line in f:
+                if line.split("\t", 1)[0] in ids:
+                    names_file.write(line)
+    except FileNotFoundError:
+        return
+
+def read_unchanged(tsv_path, orders, sorter):
+    """
+        Add lines from an existing tsv output file to sorter if they came from
+        an unchanged XML file.
+
+        tsv_path: path to existing tsv file
+        orders: dictionary of {id: [order, ...]} for lines to reuse, in the
+            order lines with the same id appear in the file
+        sorter: ExternalSort object collecting output lines
+    """
+    with open_file(tsv_path, "r") as f:
+        next(f)
+        for line in f:
+            line = line.rstrip("\n")
+            id = line.split("\t", 1)[0]
+            if orders.get(id):
+                sorter.add(line, orders[id].pop(0))
+
+def tsv_sort_key(line):
+    """
+        Key used to sort tsv lines in year order.
+    """
+    return year_key(line.split("\t")[1])
+
+year_key = natsort.natsort_keygen()
+
 def main(args):
     if not args.corpus_XML_dir:
         print("Please specify directory containing XML files")
         sys.exit(1)
     args.corpus_XML_dir = os.path.join(args.corpus_XML_dir, '')
 
+    # Define name of output directory
+    base_name = os.path.dirname(args.corpus_XML_dir).rstrip("/") + "-txt"
+    annotations_str = "-gen" if args.encode_annotations_general else ""
+    annotations_str = "-spec" if args.encode_annotations_specific else annotations_str
+    txt_output_dir = base_name + annotations_str
+    # Trial ids differ from session ids, so each split mode has its own index
+    names_path = base_name + ("-trials" if args.split_trials else "") + "-names.tsv"
+
+    # Build an annotated tsv file from the plain tsv file and its name index
+    if args.from_name_index:
+        if not annotations_str or not args.tsv:
+            print("Please specify annotations to encode in a tsv file", file=sys.stderr)
+            sys.exit(1)
+        if not os.path.exists(names_path):
+            print("No name index at " + names_path + ", build one with --name_index (and the same --split_trials)", file=sys.stderr)
+            sys.exit(1)
+        # The plain tsv file must be split the same way as its name index
+        text_path = compressed_path(base_name + ".tsv", args.compress)
+        try:
+            with open(text_path + ".manifest.json", "r") as f:
+                flags = json.load(f)["flags"]
+        except (FileNotFoundError, ValueError, KeyError):
+            flags = {}
+        if flags.get("split_trials", args.split_trials) != args.split_trials:
+            print(text_path + " was written " + ("without" if args.split_trials else "with")
+                  + " --split_trials, so it doesn't match " + names_path, file=sys.stderr)
+            sys.exit(1)
+        print(timestamp(), "Encoding annotations from " + names_path, file=sys.stderr)
+        output_path = compressed_path(txt_output_dir + ".tsv", args.compress)
+        regenerate_annotations(args, text_path, names_path, output_path)
+        print("Data written to " + output_path, file=sys.stderr)
+        return
+    if args.name_index and (annotations_str or not args.tsv):
+        print("Name index can only be built while writing a plain tsv file", file=sys.stderr)
+        sys.exit(1)
+
     # Build lists of input files depending on data type
     if args.london_lives:
-        input_files = []
-        for root, _, files in os.walk(args.corpus_XML_dir, topdown=False):
-            input_files += [os.path.join(root, f) for f in files
-                            if f[-4:] == ".xml"]
+        input_files = find_london_lives(args.corpus_XML_dir, args.scan_threads)
+        # Read the date of each file without parsing all of it, skipping files
+        # with no date
+        input_files = index_london_lives(args, input_files)
     else:
         input_files = [os.path.join(args.corpus_XML_dir, f) for f in os.listdir(args.corpus_XML_dir)
         if os.path.isfile(os.path.join(args.corpus_XML_dir, f))]
 
         input_files = natsort.natsorted(input_files, key=lambda x: get_order(x))
 
-    # Define name of output directory
-    base_name = os.path.dirname(args.corpus_XML_dir).rstrip("/") + "-txt"
-    annotations_str = "-gen" if args.encode_annotations_general else ""
-    annotations_str = "-spec" if args.encode_annotations_specific else annotations_str
-    txt_output_dir = base_name + annotations_str
+    # Only record a manifest if the output is written (see write_lines)
+    output_path = compressed_path(txt_output_dir + ".tsv", args.compress) if args.tsv else txt_output_dir
+    write_manifest = args.overwrite or args.incremental or not os.path.exists(output_path)
 
     # Make directory to write files to if not doing tsv
     if not args.tsv:
         print("Writing files to " + txt_output_dir)
         if not os.path.exists(txt_output_dir):
             os.makedirs(txt_output_dir)
-    # Otherwise make header for tsv file
-    else: tsv_out = ["id\tyear\ttext"]
-
-    # Go through input files and generate output files
-    for file in tqdm(input_files):
-
-        # Change to txt file
-        if not args.london_lives and not args.tsv:
-            filename = os.path.splitext(os.path.basename(file))[0] + ".txt"
-            file_path = os.path.join(txt_output_dir, filename)
-            if os.path.exists(file_path) and not args.overwrite:
-                continue
-        # Write text to txt file
-        try:
-            # London lives
-            if args.london_lives:
-                text_from_xml, filename = encode_annotations(args, file, txt_output_dir)
-                text_from_xml = text_from_xml[2:-1]
-                # If want to output tsv file, add to tsv list
-                if args.tsv:
-                    text = re.sub("\n" , " ", text_from_xml)
-                    l = text_from_xml.split()
-                    tsv_out.append(filename + text)
-                else:
-                    # Otherwise, write data to file
-                    write_file(args, txt_output_dir, filename, text_from_xml)
-
-            # Not london lives
-            else:
-                text_from_xml = encode_annotations(args, file, txt_output_dir)[2:-1]
-                output = split_trials(text_from_xml, split_trials=args.split_trials, tsv=args.tsv, file=file)
-                # If working with tsv file, continue collecting tsv output
-                if args.tsv:
-                    tsv_out += output
-                # If not doing tsv file but still want to split trials
-                elif args.split_trials:
-                    # Iterate over every trial and write to text file
-                    for trial in output:
-                        # Filename is based on trial ID
-                        filename = trial.split("\t")[0] + ".txt"
-                        # Write to file
-                        write_file(args, txt_output_dir, filename, trial)
-                # Otherwise, just write entire session to file
-                else:
-                    filename = os.path.splitext(os.path.basename(file))[0] + ".txt"
-                    write_file(args, txt_output_dir, filename, output[0])
-        # Catch possible errors
-        except UnicodeDecodeError:
-            print("UnicodeDecodeError reading " + file + ". Skipping...")
-            continue
-        except ET.ParseError:
-            print("ParseError reading " + file + ". Skipping...")
+    # Otherwise sort tsv lines by year as they come in, spilling them to
+    # temporary files if there are too many to keep in memory
+    else: sorter = ExternalSort(tsv_sort_key, int(args.sort_buffer_size * 2**20))
+
+    # Only convert files that are new or changed since the last run if a
+    # manifest from a run with the same flags exists
+    manifest_path = output_path + ".manifest.json"
+    old_entries = {}
+    if args.incremental and os.path.exists(output_path):
+        old_entries = load_manifest(args, manifest_path)
+    entries, to_convert = check_manifest(args, input_files, old_entries)
+    if old_entries:
+        print(str(len(to_convert)) + " of " + str(len(input_files)) + " files are new or changed", file=sys.stderr)
+    # Files being reconverted must replace their old output
+    if args.incremental:
+        args.overwrite = True
+
+    # Go through input files and generate output files, in parallel if
+    # requested. Results come back in the order of to_convert either way.
+    convert = functools.partial(convert_file, args, txt_output_dir=txt_output_dir)
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers)
+        results = pool.imap(convert, to_convert)
+    else:
+        pool = None
+        results = map(convert, to_convert)
+
+    # Position of each file in input_files, used to keep the order of lines
+    # from the same year the same as in a sequential run
+    file_order = {os.path.relpath(file, args.corpus_XML_dir): i
+                  for i, file in enumerate(input_files)}
+    # Write name index rows as they come in, keeping rows of unchanged files
+    names_file = None
+    if args.name_index and (args.overwrite or not os.path.exists(names_path)):
+        names_file = open(names_path + ".tmp", "w")
+        names_file.write(name_header + "\n")
+        if old_entries:
+            copy_names(names_path, names_file, set(to_convert), entries, args.corpus_XML_dir)
+    for file, (output, names) in zip(to_convert, tqdm(results, total=len(to_convert))):
+        rel = os.path.relpath(file, args.corpus_XML_dir)
+        entries[rel]["ids"] = [line.split("\t", 1)[0] for line in output]
+        # If working with tsv file, continue collecting tsv output
+        if args.tsv:
+            for i, line in enumerate(output):
+                sorter.add(line, (file_order[rel] << 32) + i)
+        if names_file:
+            for line in names:
+                names_file.write(line + "\n")
+
+    if pool:
+        pool.close()
+        pool.join()
+    if names_file:
+        names_file.close()
+        os.replace(names_path + ".tmp", names_path)
 
     # If writing to tsv file, combine all lines and write to file
     if args.tsv:
-        txt_output_dir += ".tsv"
-        # Sort in year order
-        tsv_out = [tsv_out[0]] + natsort.natsorted(tsv_out[1:], key=lambda x: x.split("\t")[1])
-        # Write to tsv file
-        write_file(args, txt_output_dir, "", "\n".join(tsv_out))
+        # Reuse lines of unchanged files from the existing tsv file
+        if old_entries:
+            converted = set(os.path.relpath(file, args.corpus_XML_dir) for file in to_convert)
+            orders = {}
+            for rel, entry in entries.items():
+                if rel in converted: continue
+                for i, id in enumerate(entry["ids"]):
+                    orders.setdefault(id, []).append((file_order[rel] << 32) + i)
+            read_unchanged(output_path, orders, sorter)
+        txt_output_dir = output_path
+        # Write to tsv file in year order
+        write_lines(args, txt_output_dir, "id\tyear\ttext", sorter)
+
+    # Record what was converted so the next run can skip unchanged files
+    if write_manifest:
+        with open(manifest_path, "w") as f:
+            json.dump({"flags": manifest_flags(args), "files": entries}, f)
 
     print("Data written to " + txt_output_dir, file=sys.stderr)
 
@@ -317,5 +1002,13 @@ if __name__ == '__main__':
     parser.add_argument('--split_trials', default=False, action="store_true", help='whether or not to split data into trials')
     parser.add_argument('--london_lives', default=False, action="store_true", help='whether or not input is London Lives corpus')
     parser.add_argument('--tsv', default=1, type=int, help="whether or not to store output as tsv")
+    parser.add_argument('--stream', default=False, action="store_true", help='whether or not to parse XML files incrementally to keep memory use flat')
+    parser.add_argument('--workers', default=1, type=int, help='number of processes to convert XML files with')
+    parser.add_argument('--sort_buffer_size', default=512, type=float, help='megabytes of tsv lines to sort in memory before spilling to temporary files')
+    parser.add_argument('--incremental', default=False, action="store_true", help='whether or not to only convert files that are new or changed since the last run')
+    parser.add_argument('--compress', type=str, default="", help='compression to write tsv output with ("gzip" or "lzma", default none)')
+    parser.add_argument('--scan_threads', default=8, type=int, help='number of threads to find London Lives files and read their dates with')
+    parser.add_argument('--name_index', default=False, action="store_true", help='whether or not to write the position and information of every name to a sidecar tsv file (plain tsv output only)')
+    parser.add_argument('--from_name_index', default=False, action="store_true", help='whether or not to build annotated tsv output from the plain tsv file and its name index instead of the XML files')
     args = parser.parse_args()
     main(args)
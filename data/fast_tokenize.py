@@ -0,0 +1,128 @@
+###############################################################################
+# fast_tokenize.py
+#
+# Regular expression tokenizer that splits text the way NLTK's word_tokenize
+# (Treebank conventions) does, without running Punkt and the Treebank
+# substitutions one after another. Select it with --tokenizer=fast in
+# run_tokenize.py and ngrams.py.
+#
+###############################################################################
+
+import re
+
+# Abbreviations that don't end a sentence when followed by a period (as
+# well as single capital letters, e.g., "Q." and "A." in trial questions and
+# answers, or initials)
+abbreviations = {"mr", "mrs", "messrs", "dr", "st", "no", "viz", "wm", "jno",
+                 "geo", "tho", "chas", "jas", "esq", "co", "ld", "capt", "col",
+                 "gen", "rev", "sen", "jun", "vs"}
+
+# Sentence boundary candidates: end punctuation and closing quotes/brackets,
+# then whitespace, then the start of a new sentence
+sent_re = re.compile(r"""(?<=[.!?])[\]\)}"'”’]*\s+(?=[\[\(\{"'“‘`]*[A-Z0-9])""")
+
+# Characters that are always tokens on their own
+_single = r"""[;@#$%&?!\[\](){}<>*«»“”‘’„]"""
+# Characters that end a word (a comma or colon does unless a digit follows)
+_stop = r"""(?:[\s;@#$%&?!\[\](){}<>*«»“”‘’„"`]|[,:](?!\d))"""
+
+# Closing quotes and brackets that can follow the period ending a sentence
+# (two single quotes after a space open a quotation instead)
+_closers = r"""(?:[\]\)}>»”’ ]|(?<![ (\[{<])["']|'(?!'))*$"""
+
+# Where a word ends: a character that ends a word, a double quote written
+# as two single quotes, a double dash, an ellipsis, the period ending the
+# sentence, or the end of the sentence
+_end = r"""(?:""" + _stop + r"""|''|--|\.{2,}|\.""" + _closers + r"""|$)"""
+# A single quote split from the word that follows it: before a one letter
+# word other than a clitic (e.g., "'I'll")
+_quote_split = r"""'(?!(?i:re|ve|ll|m|t|s|d|n))\w\b"""
+
+# One alternative per kind of token, tried in order at each position
+token_re = re.compile(r"""
+    (?P<quote>``|''|")
+  | \.{2,}
+  | --
+  | """ + _single + r"""
+  # Comma or colon, unless followed by a digit (e.g., "1,000")
+  | [,:](?!\d)
+  # Period ending the sentence (possibly followed by closing quotes)
+  | \.(?=""" + _closers + r""")
+  # Opening single quote split from the word that follows it
+  | '(?=\b(?i:can)not\b|\b(?i:gon|got|wan)na\b|\b(?i:gim|lem)me\b|""" + _quote_split[1:] + r""")
+  # Contractions split in two: "can|not", "gon|na", "gim|me", ...
+  | \b(?i:can)(?=not\b)
+  | \b(?i:gon|got|wan)(?=na\b)
+  | \b(?i:gim|lem)(?=me\b)
+  | (?i:'t)(?=is\b|was\b)
+  # Plain word followed by a space (the common case)
+  | \w+(?=\s)
+  # Word, stopping before a clitic ("do|n't", "it|'s") or trailing quote
+  # (a clitic other than 's, 'm or 'd can be followed by a trailing quote)
+  | (?:[^\s.,:'"`-]|[,:](?=\d)|\.(?!\.|""" + _closers + r""")|-(?!-)|'(?!'|""" + _quote_split[1:] + r"""))+?
+    (?=(?<!')(?i:n't|'ll|'re|'ve)'?""" + _end + r"""|(?i:'s|'m|'d)?""" + _end + r"""|'""" + _end + r"""|""" + _quote_split + r""")
+  # Clitic or trailing quote split from a word
+  | (?i:n't|'s|'m|'d|'ll|'re|'ve)
+  | '
+  # Anything else (e.g., a lone period or hyphen)
+  | \S
+""", re.VERBOSE)
+
+def sent_tokenize(text):
+    """
+        Split text into sentences at ".", "!" or "?" followed by whitespace and
+        an uppercase letter or digit, unless the period ends a common
+        abbreviation (e.g., "Mr.") or a single capital letter (e.g., "Q.").
+
+        input:
+            text (str): text to split
+
+        returns list of sentences
+    """
+    sentences = []
+    start = 0
+    for match in sent_re.finditer(text):
+        before = text[start:match.start()].rstrip("])}\"'”’")
+        last_word = before.rsplit(None, 1)[-1] if before.strip() else ""
+        if before.endswith(".") and (last_word[:-1].lower() in abbreviations
+                                     or re.fullmatch("[A-Z]", last_word[:-1])):
+            continue
+        sentences.append(text[start:match.start()] + match.group().rstrip())
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:])
+    return [s.strip() for s in sentences if s.strip()]
+
+def tokenize_sentence(sentence):
+    """
+        Split one sentence into tokens. Double quotes become `` at the start
+        of a quotation and '' at the end, as in the Treebank conventions (two
+        single quotes only become `` after a space or opening bracket).
+
+        input:
+            sentence (str): sentence to split
+
+        returns list of tokens
+    """
+    tokens = []
+    for match in token_re.finditer(sentence):
+        token = match.group()
+        if match.lastgroup == "quote" and token == '"':
+            prev = sentence[match.start() - 1] if match.start() else " "
+            token = "``" if prev in " \t\n([{<" else "''"
+        elif match.lastgroup == "quote" and token == "''" and match.start():
+            token = "``" if sentence[match.start() - 1] in " \t\n([{<" else "''"
+        tokens.append(token)
+    return tokens
+
+def word_tokenize(text):
+    """
+        Split text into sentences and then into tokens, like
+        nltk.tokenize.word_tokenize.
+
+        input:
+            text (str): text to tokenize
+
+        returns list of tokens
+    """
+    return [token for sentence in sent_tokenize(text) for token in tokenize_sentence(sentence)]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# make_synthetic_xml.py
+#
+# Write synthetic sessions papers and Ordinary's accounts in the same XML
+# structure as the Old Bailey corpus, for benchmarking data_reader.py.
+#
+###############################################################################
+
+import sys, argparse, os, random
+from xml.sax.saxutils import escape
+sys.path.append('../')
+from utils import *
+
+words = ("the prisoner was indicted for stealing a silver watch value 40 s. "
+         "and a pair of shoes from the house of his master on the 12th of "
+         "August last I saw him take it out of my shop went after him and "
+         "found it upon him Q. Did you know him before ? A. Yes , he "
+         "lodged with me about three weeks he said he bought it in Smithfield "
+         "guilty death transportation acquitted").split()
+surnames = ["SMITH", "JONES", "BROWN", "TAYLOR", "WILLIAMS", "WHITE", "HALL", "GREEN"]
+givens = ["JOHN", "MARY", "WILLIAM", "ELIZABETH", "THOMAS", "ANN", "SARAH", "JAMES"]
+genders = ["male", "female", "indeterminate"]
+name_types = ["defendantName", "victimName", "witnessName"]
+
+def person(rng, name_type):
+    """
+        Make a persName element with interp subelements for surname, given name
+        and gender. Some names are missing a value, as in the real corpus.
+
+        input:
+            rng (random.Random): random number generator
+            name_type (str): type of name (e.g., "defendantName")
+
+        returns XML string
+    """
+    given, surname = rng.choice(givens), rng.choice(surnames)
+    id = "n" + str(rng.randint(1, 10**6))
+    interps = '<interp inst="' + id + '" type="surname" value="' + surname + '"/>'
+    interps += '<interp inst="' + id + '" type="given" value="' + given + '"/>'
+    if rng.random() < 0.05:
+        interps += '<interp inst="' + id + '" type="gender"/>'
+    else:
+        interps += '<interp inst="' + id + '" type="gender" value="' + rng.choice(genders) + '"/>'
+    return ('<persName id="' + id + '" type="' + name_type + '">'
+            + given.title() + " " + surname.title() + interps + "</persName>")
+
+def paragraph(rng, args):
+    """
+        Make a paragraph of text with a persName after roughly
+        args.name_density of its words.
+
+        returns XML string
+    """
+    text = []
+    for _ in range(args.words):
+        text.append(escape(rng.choice(words)))
+        if rng.random() < args.name_density:
+            text.append(person(rng, rng.choice(name_types)))
+    return "<p>" + " ".join(text) + "</p>\n"
+
+def session_paper(rng, args, date):
+    """
+        Make a sessions paper: a div0 of type "sessionsPaper" containing a
+        front matter div1 and args.trials trial account div1s, with ids as in
+        type_dict of data_reader.py.
+
+        input:
+            rng (random.Random): random number generator
+            args (argparse object): input arguments
+            date (str): date of session in "YYYYMMDD" format
+
+        returns XML string
+    """
+    output = ['<TEI.2><text><body>\n<div0 type="sessionsPaper" id="' + date + '">\n',
+              '<interp inst="' + date + '" type="date" value="' + date + '"/>\n',
+              '<div1 type="frontMatter" id="f' + date + '-1">\n', paragraph(rng, args), '</div1>\n']
+    for trial in range(args.trials):
+        id = "t" + date + "-" + str(trial + 1)
+        output.append('<div1 type="trialAccount" id="' + id + '">\n')
+        output.append('<interp inst="' + id + '" type="collection" value="BAILEY"/>\n')
+        for _ in range(args.paragraphs):
+            output.append(paragraph(rng, args))
+        output.append('</div1>\n')
+    output.append('</div0>\n</body></text></TEI.2>\n')
+    return "".join(output)
+
+def ordinarys_account(rng, args, date):
+    """
+        Make an Ordinary's account: a div0 of type "ordinarysAccount" with no
+        trials.
+
+        returns XML string
+    """
+    id = "OA" + date
+    output = ['<TEI.2><text><body>\n<div0 type="ordinarysAccount" id="' + id + '">\n']
+    for _ in range(args.paragraphs * 4):
+        output.append(paragraph(rng, args))
+    output.append('</div0>\n</body></text></TEI.2>\n')
+    return "".join(output)
+
+def write_corpus(args, output_dir):
+    """
+        Write args.sessions sessions papers and args.accounts Ordinary's
+        accounts to output_dir, eight sessions per year starting in
+        args.start_year.
+
+        returns list of paths to XML files
+    """
+    rng = random.Random(args.seed)
+    if not os.path.exists(output_dir): os.makedirs(output_dir)
+    paths = []
+    for i in range(max(args.sessions, args.accounts)):
+        year = args.start_year + i // 8
+        date = str(year) + str(i % 8 + 1).zfill(2) + "15"
+        if i < args.sessions:
+            paths.append(os.path.join(output_dir, date + ".xml"))
+            with open(paths[-1], "w") as f:
+                f.write(session_paper(rng, args, date))
+        if i < args.accounts:
+            paths.append(os.path.join(output_dir, "OA" + date + ".xml"))
+            with open(paths[-1], "w") as f:
+                f.write(ordinarys_account(rng, args, date))
+    return paths
+
+def main(args):
+    paths = write_corpus(args, args.output_dir)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(timestamp(), "Wrote", len(paths), "files (" + str(round(size / 2**20, 1)) + " MB) to", args.output_dir, file=sys.stderr)
+
+def add_arguments(parser):
+    """
+        Add arguments controlling the synthetic corpus to an argument parser.
+    """
+    parser.add_argument('--sessions', default=10, type=int, help='number of sessions papers to write')
+    parser.add_argument('--accounts', default=2, type=int, help="number of Ordinary's accounts to write")
+    parser.add_argument('--trials', default=20, type=int, help='number of trials in each sessions paper')
+    parser.add_argument('--paragraphs', default=4, type=int, help='number of paragraphs in each trial')
+    parser.add_argument('--words', default=60, type=int, help='number of words in each paragraph')
+    parser.add_argument('--name_density', default=0.05, type=float, help='probability of a persName after each word')
+    parser.add_argument('--start_year', default=1674, type=int, help='year of first session')
+    parser.add_argument('--seed', default=0, type=int, help='random seed')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_dir', type=str, help='directory to write XML files to')
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
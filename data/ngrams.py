@@ -3,6 +3,8 @@ import nltk, json, os, sys, operator, argparse, copy
 from nltk.tokenize import word_tokenize, sent_tokenize
 from tqdm import tqdm
 from nltk.corpus import stopwords
+import fast_tokenize
+from bigram_store import write_bigram_store
 sys.path.append('../')
 from utils import *
 
@@ -22,12 +24,23 @@ def valid_file(doc, tsv=False):
     if year[0] == 1834 and year[1] < 10: return True
     return False
 
-def make_ngram_dicts(unigram_dict, bigram_dict, text):
+def make_ngram_dicts(unigram_dict, bigram_dict, text, tokenizer="nltk"):
     """
         Make dictionaries containing unigrams and bigrams given text.
+
+        input:
+            unigram_dict (dict): unigram counts to update
+            bigram_dict (dict): bigram counts to update
+            text (str): text to count ngrams in
+            tokenizer (str): "nltk" to split text with sent_tokenize and
+                word_tokenize, "fast" to split with fast_tokenize.py
     """
     # Get words excluding stopwords
-    words = [word.replace("\\", "") for sent in sent_tokenize(text) for word in word_tokenize(sent) if word not in stop_words]
+    if tokenizer == "fast":
+        tokens = fast_tokenize.word_tokenize(text)
+    else:
+        tokens = [word for sent in sent_tokenize(text) for word in word_tokenize(sent)]
+    words = [word.replace("\\", "") for word in tokens if word not in stop_words]
 
     # Filter out punctuation and collect unigrams
     words = filter(lambda w: w not in ',-;?.():!', words)
@@ -47,9 +60,9 @@ def make_ngram_dicts(unigram_dict, bigram_dict, text):
 
 def main(args):
     # Generate filenames for saving ngram json files
-    prefix = args.corpus_dir.rstrip("/") + "/" if not args.tsv_corpus else re.sub(".tsv/*", "", args.tsv_corpus) + "-"
-    uni_out = prefix + "corpus_unigrams.json"
-    bi_out = prefix + "corpus_bigrams.json"
+    prefix = args.corpus_dir.rstrip("/") + "/" if not args.tsv_corpus else re.sub(".tsv/*", "", strip_compression(args.tsv_corpus)) + "-"
+    uni_out = compressed_path(prefix + "corpus_unigrams.json", args.compress)
+    bi_out = compressed_path(prefix + "corpus_bigrams.json", args.compress)
     # Exit if files exist and overwrite flag is false
     if os.path.isfile(bi_out) and not args.overwrite:
         print("Bigram file already exists. Include overwrite flag to recompute bigrams.", file=sys.stderr)
@@ -61,11 +74,14 @@ def main(args):
     # Make dictionaries from text in all files
     # List of valid files (make sure to exclude json files)
     files_dict, _ = order_files(args)
-    docs = list(files_dict.values())[0]
+    docs = [doc for doc_list in files_dict.values() for doc in doc_list]
     # Want only 1674 through Oct 1834
-    if not args.disable_filter:
+    if not args.disable_filter and not args.year_range:
         print(timestamp(),"Filtering input files to all files between 1674 and October 1834...", file=sys.stderr)
-        docs = [doc for doc in docs if valid_file(doc, tsv=args.tsv_corpus)]
+        if args.doc_index and args.tsv_corpus:
+            docs = DocIndex(docs).select(end=(1834, 10))
+        else:
+            docs = [doc for doc in docs if valid_file(doc, tsv=args.tsv_corpus)]
 
     print(timestamp(),"Computing unigrams and bigrams...", file=sys.stderr)
     unigram_dict = {}
@@ -73,8 +89,8 @@ def main(args):
     # Iterate over each file and add unigram and bigram counts to
     # dictionaries
     for doc in tqdm(docs):
-        text = doc.split("\t")[2] if args.tsv_corpus else open(doc).read()
-        unigram_dict, bigram_dict = make_ngram_dicts(unigram_dict, bigram_dict, text)
+        text = doc.split("\t")[2] if args.tsv_corpus else open_file(doc).read()
+        unigram_dict, bigram_dict = make_ngram_dicts(unigram_dict, bigram_dict, text, args.tokenizer)
 
     # Sort dictionaries in order of most common ngrams
     unigram_dict = dict(sorted(unigram_dict.items(), key=operator.itemgetter(1)))
@@ -82,13 +98,18 @@ def main(args):
 
     # Write bigram dictionary to output file
     b = json.dumps(bigram_dict)
-    with open(bi_out, "w") as f:
+    with open_file(bi_out, "w") as f:
         f.write(b)
     print(timestamp() + " Wrote bigram dictionary to", bi_out, file=sys.stderr)
 
+    # Write bigram store (memory-mapped by run_tokenize.py)
+    store_out = prefix + "corpus_bigrams.bin"
+    write_bigram_store(store_out, bigram_dict)
+    print(timestamp() + " Wrote bigram store to", store_out, file=sys.stderr)
+
     # Write unigram dictionary to output file
     u = json.dumps(unigram_dict)
-    with open(uni_out, "w") as f:
+    with open_file(uni_out, "w") as f:
         f.write(u)
     print(timestamp() + " Wrote unigram dictionary to", uni_out, file=sys.stderr)
 
@@ -101,8 +122,12 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--tsv_corpus', type=str, default="", help='directory containing corpus')
+    parser.add_argument('--doc_index', default=False, action="store_true", help='whether or not to read documents of the tsv corpus through a document index (built next to it the first time) instead of loading the whole file')
     parser.add_argument('--corpus_dir', type=str, default="/work/clambert/thesis-data/OB_LL-txt", help='directory containing corpus')
     parser.add_argument('--overwrite', default=False, action="store_true", help='whether or not to overwrite old files with the same names')
+    parser.add_argument('--compress', type=str, default="", help='compression to write unigram and bigram json files with ("gzip" or "lzma", default none)')
+    parser.add_argument('--tokenizer', type=str, default="nltk", choices=["nltk", "fast"], help='tokenizer to split text with ("fast" is a regular expression tokenizer that splits like nltk)')
     parser.add_argument('--disable_filter', default=False, action="store_true", help='whether or not to disable filtering between 1674 and 1834')
+    parser.add_argument('--year_range', type=str, default='', help='ranges of years of documents to include instead of filtering between 1674 and October 1834 (e.g., "1674:1834-10,1834-10:1914")')
     args = parser.parse_args()
     main(args)
@@ -1,28 +1,60 @@
 #!/usr/bin/env python3
-import sys, optparse, os,shutil
+import sys, optparse, os,shutil, heapq, itertools, natsort
 import numpy as np
 sys.path.append("..")
-from utils import timestamp
+from utils import timestamp, open_file, strip_compression, compressed_path
+
+# Header line of tsv files
+header = "id\tyear\ttext"
+
+def read_split(path):
+    """
+        Read the lines of a tsv file one at a time, leaving out empty lines and
+        header lines.
+    """
+    with open_file(path, 'r') as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line and line.lower() != header:
+                yield line
+
+def has_header(path):
+    """
+        Check whether the first line of a tsv file is a header.
+    """
+    with open_file(path, 'r') as f:
+        return f.readline().rstrip("\n").lower() == header
 
 def merge(options, args):
     """
         Functions to merge input tsv files into one tsv file. Remove temporary
-        directory if desired.
+        directory if desired. Files are read and written one line at a time, in
+        order of their split numbers, or interleaved by year if
+        options.sort_by_year is set (in the same order utils.order_files sorts
+        documents, as long as each file is already sorted by year).
     """
     print(timestamp(), "Merging TSV files...", file=sys.stderr)
     base = os.path.dirname(args[0])
     suffix = os.path.basename(args[0]).split("-")[2:]
 
     output_file = base.replace(".tsv-dir", "-" + "-".join(suffix))
+    output_file = compressed_path(output_file, options.compress)
     print(timestamp(), "Merged tokenized TSV file being written to", output_file)
-    all_lines = []
-    for file in args:
-        if "split-" not in os.path.basename(file): continue
-        with open(file, 'r') as f:
-            all_lines += f.read().split("\n")
-    # all_lines = [header] + all_lines
-    with open(output_file,'w') as f:
-        f.write("\n".join(all_lines))
+    files = natsort.natsorted(file for file in args if "split-" in os.path.basename(file))
+    splits = [read_split(file) for file in files]
+    if options.sort_by_year:
+        year_key = natsort.natsort_keygen()
+        lines = heapq.merge(*splits, key=lambda line: year_key(line.split("\t")[1]))
+    else:
+        lines = itertools.chain(*splits)
+
+    with open_file(output_file,'w') as f:
+        # Keep one header if the files had one
+        written = any(has_header(file) for file in files)
+        if written: f.write(header)
+        for line in lines:
+            f.write("\n" + line if written else line)
+            written = True
     if options.rm_dir: shutil.rmtree(base)
     print(timestamp(), "Done!", file=sys.stderr)
 
@@ -34,7 +66,7 @@ def split(options):
         input:
             options (argparse object): input options
     """
-    base = os.path.basename(options.tsv_corpus) + "-dir"
+    base = os.path.basename(strip_compression(options.tsv_corpus)) + "-dir"
     new_dir = os.path.join(os.path.dirname(options.tsv_corpus), base)
     if not os.path.exists(new_dir): os.makedirs(new_dir)
     else:
@@ -42,10 +74,16 @@ def split(options):
         exit(0)
 
     print(timestamp(), "Splitting TSV file...", file=sys.stderr)
-    with open(options.tsv_corpus, 'r') as f:
+    if options.balance == "bytes":
+        split_by_size(options, new_dir)
+        print(timestamp(), "Done!")
+        return
+    with open_file(options.tsv_corpus, 'r') as f:
         lines = f.read().split("\n")
         if lines[0].lower() == "id\tyear\ttext": idx = 1
         else: idx = 0
+        # Keep the header in the first file, so the merged file has one
+        first = lines[:idx]
         n = len(lines[idx:]) // options.num_splits
         splits = [lines[idx:][i * n:(i + 1) * n]
                  for i in range((len(lines[idx:]) + n - 1) // n)]
@@ -60,9 +98,68 @@ def split(options):
             # Unique file path
             out_file = os.path.join(new_dir, "split-" + str(i) + ".tsv")
             with open(out_file, 'w') as f:
-                f.write("\n".join(s))
+                f.write("\n".join(first + s if i == 0 else s))
     print(timestamp(), "Done!")
 
+def split_offsets(path, num_splits, start):
+    """
+        Find byte offsets splitting a file into num_splits pieces of about the
+        same size, each starting at the beginning of a line.
+
+        input:
+            path (str): path to file
+            num_splits (int): number of pieces
+            start (int): offset of first line to include (e.g., after header)
+
+        returns list of offsets, from start to the size of the file
+    """
+    size = os.path.getsize(path)
+    offsets = [start]
+    with open(path, "rb") as f:
+        for i in range(1, num_splits):
+            # Go to the start of the first line at or after the target offset
+            target = start + (size - start) * i // num_splits
+            if target <= offsets[-1]: continue
+            f.seek(target - 1)
+            f.readline()
+            if offsets[-1] < f.tell() < size: offsets.append(f.tell())
+    offsets.append(size)
+    return offsets
+
+def split_by_size(options, new_dir):
+    """
+        Split options.tsv_corpus into options.num_splits tsv files of about the
+        same size in bytes (and so about the same number of tokens), without
+        reading the whole file into memory. Lines are never split, so a file
+        may be larger than the others if it contains a very long line. The
+        header, if there is one, is kept in the first file.
+
+        input:
+            options (argparse object): input options
+            new_dir (str): directory to write tsv files to
+    """
+    with open(options.tsv_corpus, "rb") as f:
+        first = f.readline()
+        if first[:2] == b"\x1f\x8b" or first[:6] == b"\xfd7zXZ\x00":
+            print(timestamp(), "Can't split a compressed file by size. Exiting...", file=sys.stderr)
+            exit(1)
+    # Balance the lines after the header, then add the header to the first file
+    start = len(first) if first.rstrip(b"\r\n").lower() == b"id\tyear\ttext" else 0
+    offsets = split_offsets(options.tsv_corpus, options.num_splits, start)
+    offsets[0] = 0
+
+    with open(options.tsv_corpus, "rb") as f:
+        for i, (begin, end) in enumerate(zip(offsets, offsets[1:])):
+            # Unique file path
+            out_file = os.path.join(new_dir, "split-" + str(i) + ".tsv")
+            f.seek(begin)
+            with open(out_file, "wb") as out:
+                remaining = end - begin
+                while remaining > 0:
+                    block = f.read(min(1 << 20, remaining))
+                    out.write(block)
+                    remaining -= len(block)
+
 def main(options, args):
     if len(args) > 0:
         merge(options, args)
@@ -75,7 +172,10 @@ def main(options, args):
 if __name__ == '__main__':
     parser = optparse.OptionParser(usage="usage: %prog [options] tsv_corpus1 tsv_corpus2 ...")
     parser.add_option('--rm_dir', default=False, action='store_true', help='whether or not to remove directory after merging')
+    parser.add_option('--sort_by_year', default=False, action='store_true', help='whether or not to merge lines of tsv files in order of year (each file must be sorted by year)')
     parser.add_option('--tsv_corpus', type=str, default='', help='path to tsv file to split')
+    parser.add_option('--compress', type=str, default='', help='compression to write merged tsv file with ("gzip" or "lzma", default none)')
+    parser.add_option('--balance', type='choice', choices=['lines', 'bytes'], default='lines', help='whether to give each split the same number of lines ("lines") or about the same size ("bytes")')
     parser.add_option('--num_splits', type=int, default=4, help='how many tsv files to split options.tsv_corpus into')
     (options, args) = parser.parse_args()
     main(options, args)
@@ -8,17 +8,316 @@
 #
 ###############################################################################
 
-import sys, argparse, os, re, enchant, json, nltk
+import sys, argparse, os, re, enchant, json, nltk, sqlite3, collections, hashlib, itertools, multiprocessing, time
 from tqdm import tqdm
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 from nltk.util import ngrams
 from nltk.corpus import stopwords
+import fast_tokenize
+from bigram_store import BigramStore, is_bigram_store
 sys.path.append('../')
 from utils import *
 
 stop_words = set(stopwords.words('english'))
 
+# Functions splitting a line into tokens, selected with --tokenizer
+tokenizers = {"nltk": word_tokenize, "fast": fast_tokenize.word_tokenize}
+
+class SpellCache:
+    """
+        Bounded LRU cache of spell_correct results. If a path is given, results
+        are also stored in a sqlite database so they can be reused by later runs
+        and by other processes tokenizing at the same time. Results are keyed on
+        the word and a fingerprint of the dictionaries and bigrams used, so
+        results computed with different word lists are never mixed up.
+    """
+    def __init__(self, max_size, path="", fingerprint="", flush_every=10000):
+        self.max_size = max_size
+        self.fingerprint = fingerprint
+        self.flush_every = flush_every
+        self.entries = collections.OrderedDict()
+        # Results not written to the database yet
+        self.new = {}
+        self.hits = self.disk_hits = self.misses = 0
+        self.path = path
+        self.db = None
+        if path:
+            self.connect()
+            # Start with as many of the stored results as fit in memory
+            rows = self.db.execute("SELECT word, correction FROM corrections WHERE fingerprint = ? "
+                                   "LIMIT ?", (fingerprint, max_size))
+            self.entries.update(rows)
+
+    def connect(self):
+        """
+            Open the database. A connection can't be used after a fork, so each
+            worker process opens its own.
+        """
+        if not self.path: return
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS corrections (fingerprint TEXT, "
+                        "word TEXT, correction TEXT, PRIMARY KEY (fingerprint, word))")
+
+    def close(self):
+        """
+            Write new results to the database and close it.
+        """
+        self.flush()
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def take_counts(self):
+        """
+            returns (hits, database hits, misses) since the last call
+        """
+        counts = (self.hits, self.disk_hits, self.misses)
+        self.hits = self.disk_hits = self.misses = 0
+        return counts
+
+    def add_counts(self, counts):
+        """
+            Add counts returned by take_counts (e.g., in a worker process).
+        """
+        self.hits += counts[0]
+        self.disk_hits += counts[1]
+        self.misses += counts[2]
+
+    def get(self, word):
+        """
+            Look up a word, first in memory then in the database.
+
+            returns correction or None if word has not been spell-checked
+        """
+        correction = self.entries.get(word)
+        if correction is not None:
+            self.hits += 1
+            self.entries.move_to_end(word)
+            return correction
+        if self.db:
+            row = self.db.execute("SELECT correction FROM corrections WHERE fingerprint = ? AND word = ?",
+                                  (self.fingerprint, word)).fetchone()
+            if row:
+                self.disk_hits += 1
+                self.add(word, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def add(self, word, correction):
+        """
+            Add a word to memory, removing the least recently used word if full.
+        """
+        self.entries[word] = correction
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def put(self, word, correction):
+        """
+            Store the correction of a word that was just spell-checked.
+        """
+        self.add(word, correction)
+        if self.db:
+            self.new[word] = correction
+            if len(self.new) >= self.flush_every: self.flush()
+
+    def flush(self):
+        """
+            Write new results to the database.
+        """
+        if not self.db or not self.new: return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO corrections VALUES (?, ?, ?)",
+                                [(self.fingerprint, w, c) for w, c in self.new.items()])
+        self.new = {}
+
+    def report(self):
+        """
+            returns string describing cache hits and misses
+        """
+        total = self.hits + self.disk_hits + self.misses
+        rate = 100 * (self.hits + self.disk_hits) / total if total else 0
+        return (str(self.hits) + " hits, " + str(self.disk_hits) + " database hits, "
+                + str(self.misses) + " misses (" + str(round(rate, 1)) + "% hit rate)")
+
+def spell_fingerprint(args):
+    """
+        Fingerprint of everything spell_correct depends on besides the word:
+        the dictionary, the personal word list, the corpus bigrams and the
+        splitter.
+    """
+    h = hashlib.sha1()
+    parts = ["en_GB", args.myspell_path, file_hash(args.pwl_path), file_hash(args.corpus_bigrams)]
+    # Splits found by WordSplitter can differ from enchant's
+    if args.splitter != "enchant": parts.append(args.splitter)
+    for part in parts:
+        h.update(part.encode() + b"\0")
+    return h.hexdigest()
+
+class WordSplitter:
+    """
+        Drop-in replacement for the enchant dictionary's suggest method in
+        correct_word, which only accepts a suggestion that splits a word into
+        two. Instead of searching for every suggestion within a few edits, try
+        each split point of the word and keep the splits where both halves are
+        in the personal word list (e.g., "entrancei" -> "entrance i"). Every
+        word in a corpus bigram is in the personal word list, so this finds
+        every split that could be chosen.
+    """
+    def __init__(self, pwl_path, bigrams):
+        with open_file(pwl_path) as f:
+            self.words = set(f.read().split())
+        self.bigrams = bigrams
+
+    def check(self, word):
+        return word in self.words
+
+    def suggest(self, word):
+        """
+            returns splits of word into two words in the personal word list,
+            most common in the corpus bigrams first
+        """
+        splits = [word[:i] + " " + word[i:] for i in range(1, len(word))
+                  if word[:i] in self.words and word[i:] in self.words]
+        return sorted(splits, key=lambda split: self.bigrams.get(split, 0), reverse=True)
+
+class TokenCache:
+    """
+        Caches of the steps of tokenize_line that only depend on one token:
+        splitting and spell-checking a token from word_tokenize (split_token),
+        and cleaning up, filtering, lemmatizing and marking a token once
+        contractions have been replaced (normalize_token). The flags used are
+        the same for a whole run, so tokens are the only keys needed. At most
+        max_size tokens are added to each cache.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.split = {}
+        self.normal = {}
+        # Hits and misses of each cache
+        self.counts = [0, 0, 0, 0]
+
+    def split_token(self, args, tok, gb, gb_and_pwl, bigrams):
+        """
+            returns split_token(...), computed once per token
+        """
+        subtokens = self.split.get(tok)
+        if subtokens is not None:
+            self.counts[0] += 1
+            return subtokens
+        self.counts[1] += 1
+        subtokens = split_token(args, tok, gb, gb_and_pwl, bigrams)
+        if len(self.split) < self.max_size: self.split[tok] = subtokens
+        return subtokens
+
+    def normalize_token(self, args, tok):
+        """
+            returns normalize_token(...), computed once per token
+        """
+        if tok in self.normal:
+            self.counts[2] += 1
+            return self.normal[tok]
+        self.counts[3] += 1
+        normalized = normalize_token(args, tok)
+        if len(self.normal) < self.max_size: self.normal[tok] = normalized
+        return normalized
+
+    def take_counts(self):
+        """
+            returns hits and misses of each cache since the last call
+        """
+        counts = self.counts
+        self.counts = [0, 0, 0, 0]
+        return counts
+
+    def add_counts(self, counts):
+        """
+            Add counts returned by take_counts (e.g., in a worker process).
+        """
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+
+    def report(self):
+        """
+            returns string describing cache hits and misses
+        """
+        output = []
+        for name, hits, misses in [("split", self.counts[0], self.counts[1]),
+                                   ("normalize", self.counts[2], self.counts[3])]:
+            rate = 100 * hits / (hits + misses) if hits + misses else 0
+            output.append(name + " " + str(hits) + " hits, " + str(misses)
+                          + " misses (" + str(round(rate, 1)) + "% hit rate)")
+        return "; ".join(output)
+
+class StageProfile:
+    """
+        Wall time, number of calls and number of tokens processed by each stage
+        of tokenize_line, written as json to path at the end of the run. The
+        "split" stage includes the "spell_check" and "spell_suggest" stages, and
+        "line" is all of tokenize_line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    def add(self, stage, start, tokens=1):
+        """
+            Add a call to a stage that started at time start (from
+            time.perf_counter()) and processed the given number of tokens.
+        """
+        counts = self.stages.setdefault(stage, [0, 0.0, 0])
+        counts[0] += 1
+        counts[1] += time.perf_counter() - start
+        counts[2] += tokens
+
+    def take_counts(self):
+        """
+            returns counts of each stage since the last call
+        """
+        stages = self.stages
+        self.stages = {}
+        return stages
+
+    def add_counts(self, stages):
+        """
+            Add counts returned by take_counts (e.g., in a worker process).
+        """
+        for stage, (calls, seconds, tokens) in stages.items():
+            counts = self.stages.setdefault(stage, [0, 0.0, 0])
+            counts[0] += calls
+            counts[1] += seconds
+            counts[2] += tokens
+
+    def write(self, args):
+        """
+            Print the time spent in each stage and write it to self.path.
+        """
+        breakdown = {"flags": checkpoint_flags(args), "seconds": time.perf_counter() - self.start, "stages": {}}
+        total = self.stages.get("line", [0, 0.0, 0])[1]
+        for stage, (calls, seconds, tokens) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            breakdown["stages"][stage] = {"calls": calls, "seconds": seconds, "tokens": tokens,
+                                          "tokens_per_second": tokens / seconds if seconds else 0}
+            print(timestamp() + " " + stage + ": " + str(round(seconds, 2)) + " s ("
+                  + str(round(100 * seconds / total, 1) if total else 0) + "% of line), "
+                  + str(calls) + " calls, " + str(round(tokens / seconds if seconds else 0)) + " tokens/s", file=sys.stderr)
+        with open(self.path, "w") as f:
+            json.dump(breakdown, f, indent=2)
+        print(timestamp() + " Wrote stage timing to", self.path, file=sys.stderr)
+
+# Cache of spell_correct results, set up in main
+spell_cache = None
+
+# Cache of token normalization steps, set up in main
+token_cache = None
+
+# Time spent in each stage of tokenize_line, set up in main if profiling
+profile = None
+
+# Read-only state used to tokenize tsv lines, set in main before worker
+# processes are started so they inherit it instead of loading it again
+shared = {}
+
 def contractions(token_list):
     """
         Function to replace split up contractions with two full words
@@ -60,6 +359,13 @@ def make_bigrams(tokens):
         output.append(bigram[0] + "_" + bigram[1])
     return output
 
+# Lemmatizer shared by every call to remove_unwanted (WordNet is loaded the
+# first time it is used). Lemmas are cached by TokenCache.normalize_token.
+lemmatizer = WordNetLemmatizer()
+
+# Pattern to find tokens containing a letter
+letter_pattern = re.compile('[a-zA-Z]')
+
 def remove_unwanted(args, tokens):
     """
         Remove unwanted words from tokens including words that are too short
@@ -71,20 +377,61 @@ def remove_unwanted(args, tokens):
 
         return list of tokens with unwanted ones removed.
     """
-    if args.disable_stopwords: s = []
-    else: s = stop_words
-
+    s = () if args.disable_stopwords else stop_words
+    tokens = [x for x in tokens if len(x) > 2
+              and x.lower() not in s
+              and letter_pattern.search(x)]
     if args.lemma:
-        lemmatizer = WordNetLemmatizer()
-        tokens = [lemmatizer.lemmatize(x) for x in tokens
-                  if len(x) > 2 and x.lower() not in s
-                  and re.search('[a-zA-Z]', x)]
-    else:
-        tokens = [x for x in tokens if len(x) > 2
-                  and x.lower() not in s
-                  and re.search('[a-zA-Z]', x)]
+        tokens = [lemmatizer.lemmatize(x) for x in tokens]
     return tokens
 
+# Pattern to split tokens by non-alphanumeric characters
+split_pattern = re.compile("([^A-Za-z0-9_(\w'\w)])|(^')|('$)")
+
+def split_token(args, tok, gb, gb_and_pwl, bigrams):
+    """
+        Split a token from word_tokenize by non-alphanumeric characters and
+        spell-check the pieces (unless disabled).
+
+        input:
+            args (arparse object): input arguments
+            tok (str): token from word_tokenize
+            gb: british dictionary for spell checking
+            gb_and_pwl: words from british dictionary and input personal word
+                list
+            bigrams (dict): corpus bigrams read from args.corpus_bigrams
+
+        returns list of tokens
+    """
+    # Split word by non-alphanumeric characters
+    split_word = split_pattern.split(tok)
+
+    split_word = [w for w in split_word if not w == None and len(w) > 2]
+    # Spelling correction
+    if not args.disable_spell_check:
+        split_word = [spell_correct(args, gb, gb_and_pwl, sub, bigrams) for sub in split_word]
+    # Handle issue with dashes appearing at start of word
+    return [t for w in split_word for t in w.split()]
+
+# Pattern to remove leading and trailing hyphens and slashes
+sub_pattern = re.compile('\A([\W_]*)([A-Za-z0-9]+|[A-Za-z0-9]+[\W_]+[A-Za-z0-9]+)([\W_]*)$')
+
+def normalize_token(args, tok):
+    """
+        Remove leading and trailing hyphens and slashes from a token, filter it
+        out if unwanted, lemmatize it (if args.lemma) and mark it with "$" if it
+        contains "_".
+
+        input:
+            args (arparse object): input arguments
+            tok (str): token with contractions replaced
+
+        returns normalized token, or None if it is removed
+    """
+    tokens = remove_unwanted(args, [sub_pattern.sub("\\2", tok)])
+    if not tokens: return None
+    return "$" + tokens[0] if "_" in tokens[0] else tokens[0]
+
 def tokenize_line(args, line, gb, gb_and_pwl, bigrams):
     """
         Function to tokenize one line of a file.
@@ -101,63 +448,266 @@ def tokenize_line(args, line, gb, gb_and_pwl, bigrams):
     """
     if not line.strip():
         return ""
+    if profile: line_start = time.perf_counter()
 
     # Lower line if needed
     if args.lower:
         line = line.lower()
 
     # Tokenize line
-    tokens = [word.replace("\\", "") for word in word_tokenize(line)]
+    if profile: start = time.perf_counter()
+    tokens = [word.replace("\\", "") for word in tokenizers[args.tokenizer](line)]
+    if profile: profile.add("tokenize", start, len(tokens))
 
-    # Spelling correction
+    # Split and spell-check each token, once per distinct token if caching
+    if profile: start = time.perf_counter()
     updated_tokens = []
-    for i, tok in enumerate(tokens):
-        # Split word by non-alphanumeric characters
-        split_word = re.split("([^A-Za-z0-9_(\w'\w)])|(^')|('$)", tok)
-
-        split_word = [w for w in split_word if not w == None and len(w) > 2]
-        if args.disable_spell_check:
-            updated_tokens += split_word
-            continue
-
-        for sub in split_word:
-            spell_checked = spell_correct(args, gb, gb_and_pwl, sub, bigrams).split()
-            updated_tokens += spell_checked
-    tokens = updated_tokens
-    # Handle issue with dashes appearing at start of word
-    mod_tokens = []
-    for i in range(len(tokens)):
-        mod_tokens += tokens[i].split()
-    tokens = mod_tokens
-
-    # Replace split contractions with full words
-    tokens = contractions(tokens)
-
-    # First, remove trailing hyphens and slashes
-    sub_pattern = '\A([\W_]*)([A-Za-z0-9]+|[A-Za-z0-9]+[\W_]+[A-Za-z0-9]+)([\W_]*)$'
-    tokens = [re.sub(sub_pattern, "\\2", x) for x in tokens]
-    tokens = remove_unwanted(args, tokens)
-
-    for idx, t in enumerate(tokens):
-        tokens[idx] = "$" + t if "_" in t else t
+    for tok in tokens:
+        if token_cache is not None:
+            updated_tokens += token_cache.split_token(args, tok, gb, gb_and_pwl, bigrams)
+        else:
+            updated_tokens += split_token(args, tok, gb, gb_and_pwl, bigrams)
+    if profile: profile.add("split", start, len(tokens))
+
+    # Replace split contractions with full words (depends on neighboring
+    # tokens, so can't be cached by token)
+    if profile: start = time.perf_counter()
+    tokens = contractions(updated_tokens)
+    if profile: profile.add("contractions", start, len(updated_tokens))
+
+    # Clean up and filter each token, once per distinct token if caching
+    if profile: start, count = time.perf_counter(), len(tokens)
+    if token_cache is not None:
+        tokens = [token_cache.normalize_token(args, t) for t in tokens]
+    else:
+        tokens = [normalize_token(args, t) for t in tokens]
+    tokens = [t for t in tokens if t is not None]
+    if profile: profile.add("normalize", start, count)
 
     # Turn into bigrams if flag is true
     if args.bigrams:
+        if profile: start = time.perf_counter()
         tokens = make_bigrams(tokens)
+        if profile: profile.add("bigrams", start, len(tokens))
 
 
     finished = " ".join(tokens)
 
     # If needed, replace street names with generic version
     if args.street_sub:
+        if profile: start = time.perf_counter()
         finished = re.sub("([^ ]+\-street)|([A-Z][a-z]* street)", "$name_street", finished)
+        if profile: profile.add("street_sub", start, len(tokens))
         # finished = re.sub("([^ ]+\-lane)|([A-Z][a-z]* lane)", "$name_street", finished)
         # finished = re.sub("([^ ]+\-road)|([A-Z][a-z]* road)", "$name_street", finished)
         # finished = re.sub("[^ ]+\-row", "$name_street", finished)
         # also -square, -highway, -cross, -grove, -town
 
+    if profile: profile.add("line", line_start, len(tokens))
     return finished
 
+def tokenize_doc(doc):
+    """
+        Tokenize one line of a tsv file using the dictionaries in shared.
+
+        input:
+            doc (str): tsv line of format "id\tyear\ttext"
+
+        returns tokenized tsv line, or None if doc doesn't have three columns
+    """
+    try:
+        id, year, text = doc.split("\t")
+    except ValueError: return None
+    tokenized = tokenize_line(shared["args"], text, shared["gb"], shared["gb_and_pwl"], shared["bigrams"])
+    return id + "\t" + year + "\t" + tokenized
+
+def tokenize_chunk(docs):
+    """
+        Tokenize a chunk of tsv lines.
+
+        returns list of tokenized lines, spell check cache counts, token cache
+        counts and stage timing counts
+    """
+    lines = [tokenize_doc(doc) for doc in docs]
+    counts = spell_cache.take_counts() if spell_cache else (0, 0, 0)
+    return (lines, counts, token_cache.take_counts() if token_cache else [0, 0, 0, 0],
+            profile.take_counts() if profile else {})
+
+def init_worker():
+    """
+        Set up a worker process: reopen the spell check database and make sure
+        new results are written to it when the worker exits.
+    """
+    if spell_cache:
+        spell_cache.connect()
+        multiprocessing.util.Finalize(spell_cache, spell_cache.close, exitpriority=10)
+
+def imap_bounded(pool, func, items, window):
+    """
+        Like pool.imap, but only read the next item once fewer than window
+        results are pending (pool.imap reads all items as fast as it can).
+
+        yields func(item) for each item, in order
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def tokenize_docs(args, docs):
+    """
+        Tokenize lines of a tsv file in chunks of args.chunk_size lines, in
+        args.workers processes if more than one. Lines are read as they are
+        needed (at most two chunks per worker ahead of the lines yielded), so
+        the whole file is never held in memory.
+
+        input:
+            args (argparse object): input arguments
+            docs (iterable): tsv lines
+
+        yields tokenized lines (None for lines without three columns) in the
+        same order as docs
+    """
+    docs = iter(docs)
+    chunks = iter(lambda: list(itertools.islice(docs, args.chunk_size)), [])
+    if args.workers > 1:
+        # Workers open their own connections to the spell check database
+        if spell_cache: spell_cache.close()
+        # Workers must be forked to inherit shared and the caches (enchant
+        # dictionaries can't be pickled and sent to them), whatever the
+        # platform's default start method is
+        pool = multiprocessing.get_context("fork").Pool(args.workers, initializer=init_worker)
+        results = imap_bounded(pool, tokenize_chunk, chunks, 2 * args.workers)
+    else:
+        pool = None
+        results = map(tokenize_chunk, chunks)
+
+    for lines, counts, token_counts, stage_counts in results:
+        if spell_cache: spell_cache.add_counts(counts)
+        if token_cache: token_cache.add_counts(token_counts)
+        if profile: profile.add_counts(stage_counts)
+        yield from lines
+
+    if pool:
+        pool.close()
+        pool.join()
+
+def checkpoint_flags(args):
+    """
+        Return the command line flags that change the tokenized output. A
+        checkpoint written with different flags can't be resumed from.
+    """
+    run_flags = ["overwrite", "resume", "checkpoint_every", "workers", "chunk_size",
+                 "spell_cache", "spell_cache_size", "token_cache_size", "profile_stages"]
+    return {flag: value for flag, value in sorted(vars(args).items()) if flag not in run_flags}
+
+def write_checkpoint(checkpoint_path, args, out, lines, id, token_ids=None):
+    """
+        Flush tokenized output to disk and record how far tokenization has got,
+        so an interrupted run can be resumed with --resume.
+
+        input:
+            checkpoint_path (str): path to write checkpoint to
+            args (argparse object): input arguments
+            out (file): output tsv file
+            lines (int): number of input lines (after the header) tokenized
+            id (str): id of last document written
+            token_ids (TokenIdWriter): writer of token id corpus, if any
+    """
+    out.flush()
+    os.fsync(out.fileno())
+    checkpoint = {"flags": checkpoint_flags(args), "lines": lines, "id": id,
+                  "bytes": os.fstat(out.fileno()).st_size}
+    if token_ids: checkpoint["token_ids"] = token_ids.state()
+    with open(checkpoint_path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+def load_checkpoint(args, checkpoint_path, output_file):
+    """
+        Load the checkpoint of an interrupted run if it can be resumed from.
+
+        returns checkpoint dictionary, or None to start from the beginning
+    """
+    if not os.path.exists(checkpoint_path) or not os.path.exists(output_file):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["flags"] != checkpoint_flags(args):
+        print(timestamp() + " Flags differ from checkpoint " + checkpoint_path + ", starting from the beginning", file=sys.stderr)
+        return None
+    print(timestamp() + " Resuming after " + str(checkpoint["lines"]) + " lines (document " + str(checkpoint["id"]) + ")", file=sys.stderr)
+    return checkpoint
+
+def tokenize_tsv(args, output_file):
+    """
+        Tokenize args.tsv_corpus line by line, writing each tokenized line to
+        output_file as soon as it (and every line before it) is done. Every
+        args.checkpoint_every lines, the output is flushed and a checkpoint is
+        written next to it. With args.resume, lines tokenized before the last
+        checkpoint are skipped and the rest are added to the output. With
+        args.token_ids, the tokenized corpus is also written as token ids to a
+        directory next to output_file (see TokenIdWriter in utils.py).
+
+        input:
+            args (argparse object): input arguments
+            output_file (str): path to write tokenized tsv file to
+    """
+    # Checkpoints use byte offsets, which only make sense in uncompressed files
+    checkpoint_path = output_file + ".checkpoint.json" if not args.compress else ""
+    checkpoint = load_checkpoint(args, checkpoint_path, output_file) if checkpoint_path and args.resume else None
+    ids_path = strip_compression(output_file)[:-4] + "-ids"
+
+    with open_file(args.tsv_corpus, 'r') as f:
+        docs = (line.rstrip("\n") for line in f)
+        header = next(docs, None)
+        has_header = header is not None and header.lower() == "id\tyear\ttext"
+        # Tokenize first line too if there is no header
+        if header is not None and not has_header: docs = itertools.chain([header], docs)
+
+        if checkpoint:
+            # Skip lines already tokenized, making sure the input is the same
+            skipped, id = 0, None
+            for doc in itertools.islice(docs, checkpoint["lines"]):
+                skipped += 1
+                if doc.count("\t") == 2: id = doc.split("\t", 1)[0]
+            if skipped < checkpoint["lines"] or id != checkpoint["id"]:
+                print(timestamp() + " Input doesn't match checkpoint " + checkpoint_path + ". Exiting...", file=sys.stderr)
+                exit(1)
+            # Drop anything written after the checkpoint
+            os.truncate(output_file, checkpoint["bytes"])
+            out = open_file(output_file, "a")
+            token_ids = TokenIdWriter(ids_path, checkpoint["token_ids"]) if args.token_ids else None
+            lines = checkpoint["lines"]
+            written = checkpoint["bytes"] > 0
+        else:
+            out = open_file(output_file, "w")
+            token_ids = TokenIdWriter(ids_path) if args.token_ids else None
+            lines, id = 0, None
+            # Keep header if there is one
+            written = has_header
+            if written: out.write(header)
+            if checkpoint_path: write_checkpoint(checkpoint_path, args, out, lines, id, token_ids)
+
+        with out:
+            # Write tokenized lines as they come in
+            for tokenized in tokenize_docs(args, docs):
+                lines += 1
+                if tokenized is not None:
+                    out.write("\n" + tokenized if written else tokenized)
+                    written = True
+                    id = tokenized.split("\t", 1)[0]
+                    if token_ids: token_ids.add(*tokenized.split("\t", 2))
+                if checkpoint_path and lines % args.checkpoint_every == 0:
+                    write_checkpoint(checkpoint_path, args, out, lines, id, token_ids)
+        if token_ids: token_ids.close()
+
+    # Finished, so there is nothing to resume
+    if checkpoint_path and os.path.exists(checkpoint_path): os.remove(checkpoint_path)
+
 def tokenize_file(args, file, gb, gb_and_pwl, bigrams):
     """
         Function to tokenize each line in a file.
@@ -173,7 +723,7 @@ def tokenize_file(args, file, gb, gb_and_pwl, bigrams):
         returns list of tokenized lines
     """
     output = []
-    with open(file, "r") as f:
+    with open_file(file, "r") as f:
         for line in f:
             output.append(tokenize_line(args, line, gb, gb_and_pwl, bigrams))
     return output
@@ -193,11 +743,34 @@ def spell_correct(args, gb, gb_and_pwl, word, bigrams):
 
         returns spell-checked (and corrected, if necessary) word
     """
+    # Capitalized words are never corrected
+    if word == "" or word[0].isupper(): return word
+    if spell_cache is None:
+        return correct_word(gb, gb_and_pwl, word, bigrams)
+
+    correction = spell_cache.get(word)
+    if correction is None:
+        correction = correct_word(gb, gb_and_pwl, word, bigrams)
+        spell_cache.put(word, correction)
+    return correction
+
+def correct_word(gb, gb_and_pwl, word, bigrams):
+    """
+        Spell-check a lowercase word and correct it if it is two words merged
+        together, choosing the split that is most common in the corpus bigrams.
+
+        returns spell-checked (and corrected, if necessary) word
+    """
     # If the line is a valid word, continue
-    if word == "" or word[0].isupper() or gb.check(word): return word
+    if profile: start = time.perf_counter()
+    valid = gb.check(word)
+    if profile: profile.add("spell_check", start)
+    if valid: return word
     else:
         # Suggest corrections for sub_line
+        if profile: start = time.perf_counter()
         suggestions = gb_and_pwl.suggest(word)
+        if profile: profile.add("spell_suggest", start)
         # See if any of them are reasonable
         options = []
         for opt in suggestions:
@@ -253,9 +826,26 @@ def merge_words(args, pwl, input, bigrams):
 
     return output
 
+def close_caches(args):
+    """
+        Write remaining spell check results to the database and report how
+        often the caches were used (and how long each stage took if profiling).
+    """
+    if profile is not None:
+        profile.write(args)
+    if token_cache is not None:
+        print(timestamp() + " Token cache: " + token_cache.report(), file=sys.stderr)
+    if spell_cache is None: return
+    spell_cache.flush()
+    print(timestamp() + " Spell check cache: " + spell_cache.report(), file=sys.stderr)
+
 def main(args):
-    with open(args.corpus_bigrams) as json_file:
-        bigrams = json.load(json_file)
+    global spell_cache, token_cache, profile
+    if is_bigram_store(args.corpus_bigrams):
+        bigrams = BigramStore(args.corpus_bigrams)
+    else:
+        with open_file(args.corpus_bigrams) as json_file:
+            bigrams = json.load(json_file)
 
     # Define additional info to add to output path
     suffix = "-tok"
@@ -283,7 +873,15 @@ def main(args):
 
     enchant.set_param("enchant.myspell.dictionary.path", args.myspell_path)
     gb = enchant.DictWithPWL("en_GB") #, args.pwl_path) # GB isn't working, doesn't recognize 'entrancei' as "entrance i"
-    gb_and_pwl = enchant.DictWithPWL("en_GB", args.pwl_path) # GB isn't working, doesn't recognize 'entrancei' as "entrance i"
+    if args.splitter == "pwl":
+        gb_and_pwl = WordSplitter(args.pwl_path, bigrams)
+    else:
+        gb_and_pwl = enchant.DictWithPWL("en_GB", args.pwl_path) # GB isn't working, doesn't recognize 'entrancei' as "entrance i"
+    if not args.disable_spell_check:
+        fingerprint = spell_fingerprint(args) if args.spell_cache else ""
+        spell_cache = SpellCache(args.spell_cache_size, args.spell_cache, fingerprint)
+    token_cache = TokenCache(args.token_cache_size)
+    if args.profile_stages: profile = StageProfile(args.profile_stages)
 
     # If processing one file, don't loop!
     if args.filepath:
@@ -307,29 +905,23 @@ def main(args):
         # Write output to new file
         with open(output_file, "w") as f:
             f.write("\n".join(output))
+        close_caches(args)
         exit(0)
     else:
         if args.tsv_corpus:
-            output_file = args.tsv_corpus[:-4] + suffix + ".tsv"
-            if not args.overwrite and os.path.exists(output_file):
+            output_file = strip_compression(args.tsv_corpus)[:-4] + suffix + ".tsv"
+            output_file = compressed_path(output_file, args.compress)
+            if args.resume and args.compress:
+                print(timestamp() + " Can't resume writing a compressed file. Exiting...", file=sys.stderr)
+                exit(1)
+            if args.resume and os.path.exists(output_file) and not os.path.exists(output_file + ".checkpoint.json"):
+                print("File", output_file, "is already finished. Exiting...")
+                exit(0)
+            if not args.overwrite and not args.resume and os.path.exists(output_file):
                 print("File", output_file, "exists. Exiting...")
                 exit(0)
-            with open(args.tsv_corpus, 'r') as f:
-                docs = f.read().split("\n")
-                if docs[0].lower() == "id\tyear\ttext":
-                    idx = 1
-                    tsv_out = [docs[0]]
-                else:
-                    idx = 0
-                    tsv_out = []
-                for doc in docs[idx:]:
-                    try:
-                        id, year, text = doc.split("\t")
-                    except ValueError: continue
-                    tokenized = tokenize_line(args, text, gb, gb_and_pwl, bigrams)
-                    tsv_out.append(id + "\t" + year + "\t" + tokenized)
-            with open(output_file, "w") as f:
-                f.write('\n'.join(tsv_out))
+            shared.update(args=args, gb=gb, gb_and_pwl=gb_and_pwl, bigrams=bigrams)
+            tokenize_tsv(args, output_file)
         else:
             # Compile list of files to tokenize
             files = [os.path.join(args.corpus_dir, f) for f in os.listdir(args.corpus_dir)
@@ -348,6 +940,7 @@ def main(args):
                 # Write output to new file
                 with open(output_file, "w") as f:
                     f.write('\n'.join(output))
+    close_caches(args)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -360,11 +953,23 @@ if __name__ == '__main__':
     parser.add_argument('--lower', default=False, action="store_true", help='whether or not to lowercase all text')
     parser.add_argument('--street_sub', default=False, action="store_true", help='whether or not to substitute street names with generic string')
     parser.add_argument('--lemma', default=False, action="store_true", help='whether or not to lemmatize all text')
-    parser.add_argument('--corpus_bigrams', type=str, default="/work/clambert/thesis-data/OB_LL-txt/corpus_bigrams.json", help='path to json file containing dictionary of all corpus bigrams (./ngrams.py)')
+    parser.add_argument('--corpus_bigrams', type=str, default="/work/clambert/thesis-data/OB_LL-txt/corpus_bigrams.json", help='path to json file or bigram store (.bin) containing counts of all corpus bigrams (./ngrams.py)')
     parser.add_argument('--myspell_path', type=str, default="/home/clambert/.local/lib/python3.6/site-packages/enchant/share/enchant/myspell", help='path to myspell dictionary')
     parser.add_argument('--disable_spell_check', default=False, action="store_true", help='whether or not to disable spell check')
     parser.add_argument('--pwl_path', type=str, default="/work/clambert/thesis-data/OB_LL-txt/unigram_pwl.txt", help='path to unigram word list')
+    parser.add_argument('--splitter', type=str, default="enchant", choices=["enchant", "pwl"], help='how to split merged words when spell checking ("enchant" suggestions or "pwl" to try every split into two words in the personal word list)')
     parser.add_argument('--merge_words', default=False, action="store_true", help='whether or not to merge words into words present in unigram list')
+    parser.add_argument('--compress', type=str, default="", help='compression to write tsv output with ("gzip" or "lzma", default none)')
+    parser.add_argument('--spell_cache', type=str, default="", help='path to sqlite database to store spell check results in between runs (shared by parallel runs)')
+    parser.add_argument('--spell_cache_size', type=int, default=1000000, help='number of spell check results to keep in memory')
+    parser.add_argument('--token_cache_size', type=int, default=2000000, help='number of distinct tokens to remember the normalized form of')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to tokenize tsv file with')
+    parser.add_argument('--chunk_size', type=int, default=100, help='number of tsv lines to send to a worker process at a time')
+    parser.add_argument('--token_ids', default=False, action="store_true", help='whether or not to also write tokenized tsv file as a corpus of integer token ids (OUTPUT-ids directory)')
+    parser.add_argument('--checkpoint_every', type=int, default=1000, help='number of tsv lines to tokenize between checkpoints')
+    parser.add_argument('--resume', default=False, action="store_true", help='whether or not to resume tokenizing a tsv file from the last checkpoint of an interrupted run')
+    parser.add_argument('--profile_stages', type=str, default="", help='path to write json file with time spent in each stage of tokenization to (default no timing)')
+    parser.add_argument('--tokenizer', type=str, default="nltk", choices=sorted(tokenizers), help='tokenizer to split lines with ("fast" is a regular expression tokenizer that splits like nltk)')
     parser.add_argument('--disable_stopwords', default=False, action="store_true", help='whether or not to disable stop word removal')
     args = parser.parse_args()
     main(args)
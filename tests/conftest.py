@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scripts import utils.py from the repository root and are run from the
+# directory they are in
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [root, os.path.join(root, "data")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
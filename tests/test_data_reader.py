@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import root
+
+session = """<TEI.2><text><body>
+<div0 type="sessionsPaper" id="{date}">
+<interp inst="{date}" type="date" value="{date}"/>
+<div1 type="trialAccount" id="t{date}-1">
+<p>{text}</p>
+</div1>
+</div0>
+</body></text></TEI.2>
+"""
+
+def data_reader(xml_dir, *flags):
+    """
+        Run data_reader.py on a directory of XML files.
+
+        returns exit status
+    """
+    return subprocess.run([sys.executable, "data_reader.py", str(xml_dir)] + list(flags),
+                          cwd=os.path.join(root, "data")).returncode
+
+def convert(tmp_path, sessions, *flags):
+    """
+        Write each (date, text) pair in sessions to an XML file and convert
+        them with data_reader.py.
+
+        returns path to the output tsv file
+    """
+    xml_dir = tmp_path / "sessions"
+    xml_dir.mkdir()
+    for date, text in sessions:
+        (xml_dir / (date + ".xml")).write_text(session.format(date=date, text=text))
+    assert data_reader(xml_dir, *flags) == 0
+    return tmp_path / "sessions-txt.tsv"
+
+@pytest.mark.parametrize("flags,id", [([], "16740115"), (["--split_trials"], "t16740115-1")])
+def test_line_breaks_in_text(tmp_path, flags, id):
+    # "&#13;" is a carriage return, which would split the line for text readers
+    output = convert(tmp_path, [("16740115", "one&#13;two&#13;&#10;three\tfour")], *flags)
+    with open(output) as f:
+        rows = f.read().rstrip("\n").split("\n")
+    assert rows[0] == "id\tyear\ttext"
+    assert len(rows) == 2
+    row_id, year, text = rows[1].split("\t")
+    assert (row_id, year) == (id, "1674")
+    assert text.split() == ["one", "two", "three", "four"]
+
+def test_assemble_text_breaks():
+    import data_reader
+    text = data_reader.assemble_text(["a\rb", "c\x0bd\x0ce\tf", "\n", "g"])
+    assert text.split("\n") == ["a bc d e f", "g"]
+
+name = """<persName id="n1" type="witnessName">James Hall<interp inst="n1" type="surname" value="HALL"/><interp inst="n1" type="given" value="JAMES"/><interp inst="n1" type="gender" value="male"/></persName>"""
+
+def test_name_index_split_mode(tmp_path):
+    output = convert(tmp_path, [("16740115", "I saw " + name + " there")],
+                     "--split_trials", "--name_index")
+    xml_dir = tmp_path / "sessions"
+    # Each split mode has its own name index
+    assert data_reader(xml_dir, "--overwrite", "--name_index") == 0
+    assert (tmp_path / "sessions-txt-trials-names.tsv").read_text().split("\n")[1].startswith("t16740115-1\t")
+    assert (tmp_path / "sessions-txt-names.tsv").read_text().split("\n")[1].startswith("16740115\t")
+
+    # The tsv file was rewritten per session, so the trial index doesn't match it
+    assert data_reader(xml_dir, "--encode_annotations_general", "--split_trials", "--from_name_index") != 0
+    assert not (tmp_path / "sessions-txt-gen.tsv").exists()
+    assert data_reader(xml_dir, "--encode_annotations_general", "--from_name_index") == 0
+    from_index = (tmp_path / "sessions-txt-gen.tsv").read_text()
+    assert data_reader(xml_dir, "--encode_annotations_general", "--overwrite") == 0
+    from_xml = (tmp_path / "sessions-txt-gen.tsv").read_text()
+    assert from_index.split() == from_xml.split()
+    assert "witness_male" in from_index
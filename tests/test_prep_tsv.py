@@ -0,0 +1,27 @@
+import argparse
+import os
+import shutil
+
+import pytest
+
+import prep_tsv
+
+@pytest.mark.parametrize("balance", ["lines", "bytes"])
+def test_split_merge_header(tmp_path, balance):
+    lines = ["t1674%04d-1\t1674\t%s" % (i, "word " * (i % 7 + 1)) for i in range(20)]
+    corpus = tmp_path / "corpus.tsv"
+    corpus.write_text("\n".join(["id\tyear\ttext"] + lines))
+    prep_tsv.split(argparse.Namespace(tsv_corpus=str(corpus), balance=balance, num_splits=3))
+
+    # Stand in for run_tokenize.py, which keeps the header of its input
+    split_dir = tmp_path / "corpus.tsv-dir"
+    files = sorted(os.listdir(split_dir))
+    assert len(files) > 1
+    for file in files:
+        shutil.copy(split_dir / file, split_dir / file.replace(".tsv", "-tok.tsv"))
+    pieces = [str(split_dir / file.replace(".tsv", "-tok.tsv")) for file in files]
+    assert prep_tsv.has_header(pieces[0])
+    assert not any(prep_tsv.has_header(piece) for piece in pieces[1:])
+
+    prep_tsv.merge(argparse.Namespace(compress="", sort_by_year=False, rm_dir=False), pieces)
+    assert (tmp_path / "corpus-tok.tsv").read_text().split("\n") == ["id\tyear\ttext"] + lines
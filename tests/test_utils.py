@@ -0,0 +1,49 @@
+import argparse
+
+from utils import *
+
+def test_external_sort_spill():
+    # Lines may contain line breaks other than "\n"
+    lines = ["1700\tb\rc", "1690\ta", "1700\td\x0be", "1680\tf\x1cg", "1690\th\r"]
+    sorter = ExternalSort(lambda line: line.split("\t")[0], 1)
+    for i, line in enumerate(lines):
+        sorter.add(line, i)
+    assert len(sorter.runs) == len(lines)
+    assert list(sorter) == sorted(lines, key=lambda line: line.split("\t")[0])
+
+def test_order_files_doc_index_corpus_dir(tmp_path):
+    # The scripts' default tsv_corpus is a placeholder, the directory is read
+    for name in ["16740115.txt", "16750115.txt", "16850115.txt"]:
+        (tmp_path / name).write_text("text")
+    args = argparse.Namespace(doc_index=True, tsv_corpus="path to tsv file containing corpus",
+                              london_lives_file="", corpus_dir=str(tmp_path),
+                              london_lives_index="", year_split=10)
+    docs_dict, lengths = order_files(args)
+    assert list(docs_dict) == [1674, 1685]
+    assert lengths == [2, 1]
+
+def test_id_month():
+    assert id_month("t17440112-1") == 1
+    assert id_month("OA16760517") == 5
+    assert id_month("16741015") == 10
+    # London Lives ids with digits where an Old Bailey id has its month
+    assert id_month("LMA001") == 0
+    assert id_month("LMSMPS50001PS500010001") == 0
+
+def test_doc_index_month_range():
+    docs = ["t16741015-1\t1674\ta", "LMA001\t\tb", "t16750310-1\t1675\tc",
+            "LMSL123\t\td", "t16751208-2\t1675\te", "t17000115-1\t1700\tf",
+            "LMA002\t\tg", "t17001008-1\t1700\th"]
+    year_index = {"LMA001": 1675, "LMSL123": 1674, "LMA002": 1700}
+    index = DocIndex(docs, year_index)
+    ids = lambda docs: [doc_id(doc) for doc in docs]
+    # London Lives documents are in any range including their year
+    assert ids(index.select((1675, 1), (1700, 0))) == ["LMA001", "t16750310-1", "t16751208-2"]
+    assert ids(index.select((1675, 6), (1700, 2))) == ["LMA001", "t16751208-2", "LMA002", "t17000115-1"]
+    assert ids(index.select((1674, 11), (1700, 1))) == ["LMSL123", "LMA001", "t16750310-1", "t16751208-2"]
+    assert ids(index.select((1675, 6), (1700, 2), source="london_lives")) == ["LMA001", "LMA002"]
+    assert ids(index.select((1675, 6), (1675, 6))) == []
+    slices = index.slices("1674:1675-06,1675-06:1701")
+    assert {year: ids(docs) for year, docs in slices.items()} == {
+        1674: ["LMSL123", "t16741015-1", "LMA001", "t16750310-1"],
+        1675: ["LMA001", "t16751208-2", "LMA002", "t17000115-1", "t17001008-1"]}
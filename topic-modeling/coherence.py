@@ -37,7 +37,7 @@ def vector_coherence(model, T):
     try: ret = sum/acc
     except:
         ret = 0
-        print("Problem with topic:",T". Skipping...")
+        print("Problem with topic:", T, ". Skipping...")
     return ret
 
 # http://qpleple.com/topic-coherence-to-evaluate-topic-models/
@@ -88,9 +88,12 @@ def load_docs(options):
         Load documents and generate a corpus in particular format
     """
     files_dict, time_slices = order_files(options)
+    # Only count documents within the year ranges if given
+    ids = {doc_id(doc) for docs in files_dict.values() for doc in docs}
     corpus = Corpus(options.corpus_dir)
     new_corpus = {}
     for file, doc in corpus.docs.items():
+        if options.year_range and doc_id(file) not in ids: continue
         new_corpus[file] = set(doc.text().lower().split())
     return new_corpus
 
@@ -130,6 +133,8 @@ if __name__ == '__main__':
     parser = OptionParser(usage="usage: %prog [options] weighted_keys1 weighted_keys2 ...")
     parser.add_option('--method', type=str, default='vectors', help='method to use when calculating coherence')
     parser.add_option('--word2vec_model', type=str, default='', help='path to word2vec model to use in vector method')
+    parser.add_option('--corpus_dir', type=str, default='', help='directory containing corpus (for umass method)')
+    parser.add_option('--year_range', type=str, default='', help='ranges of years of documents to count in umass method (e.g., "1674:1834-10" or "1670:1840/10")')
     (options, args) = parser.parse_args()
     if(len(args) < 1):
         parser.error( "Must specify at least one weighted keys file" )
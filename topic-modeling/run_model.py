@@ -109,8 +109,11 @@ def run_lda(args, corpus, pre, dictionary=None, workers=None, docs=None, num_fil
             year, lines = docs
             os.makedirs(mallet_corpus)
             tsv_corpus = os.path.join(mallet_corpus, str(year) + "-tmp.tsv")
+            # Write one line at a time (lines may be DocHandle objects, or
+            # read from disk as they go)
             with open(tsv_corpus, 'w') as f:
-                f.write("\n".join(lines))
+                for i, line in enumerate(lines):
+                    f.write(("\n" if i else "") + line)
         else:
             tsv_corpus = args.tsv_corpus
 
@@ -215,7 +218,8 @@ def model_for_year(args, year, files, pre, time_slices):
         input:
             args (argparse object): input arguments
             year (int): time slice running model over
-            files (list): list of files in time slice
+            files (list): list of files in time slice (or DocSlice of lines
+                with --lazy_slices)
             pre (str): path to save all results to
             time_slices (list): list containing number of files per time time slice
 
@@ -282,12 +286,9 @@ def save_model_files(pre, year, model, files):
     # Save model with timestamp
     model.save(pre + "model" + append)
 
-    f = open(pre + "file_ordering" + append + ".txt", "w")
-    text = ""
-    for filename in files:
-        text += filename + " "
-    f.write(text[:-1])
-    f.close()
+    with open(pre + "file_ordering" + append + ".txt", "w") as f:
+        for i, filename in enumerate(files):
+            f.write((" " if i else "") + filename)
 
 def model_on_directory(args):
     """
@@ -346,6 +347,8 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--tsv_corpus', type=str, default='path to tsv file containing corpus')
+    parser.add_argument('--doc_index', default=False, action="store_true", help='whether or not to read documents of the tsv corpus through a document index (built next to it the first time) instead of loading the whole file')
+    parser.add_argument('--lazy_slices', default=False, action="store_true", help='whether or not to read the documents of each time slice from the tsv corpus every time they are used instead of keeping them in memory (uses the document index, see --doc_index)')
     parser.add_argument('--london_lives_file', type=str, default='')
     parser.add_argument('--save_model_dir', type=str, default="/work/clambert/models/", help='base directory for saving model directory')
     parser.add_argument('--unigrams_only', default=False, action="store_true", help='whether or not to only include unigrams')
@@ -357,6 +360,8 @@ if __name__ == '__main__':
     parser.add_argument('--optimize_interval', type=int, default=10, help='number of topics to find')
     parser.add_argument('--num_iterations', type=int, default=1000, help='number of topics to find')
     parser.add_argument('--year_split', type=int, default=100, help='Number of years per time slice')
+    parser.add_argument('--year_range', type=str, default='', help='ranges of years to split corpus into, overriding --year_split (e.g., "1674:1834-10", "1670:1840/10" for decades or "1689:1702,1702:1714")')
+    parser.add_argument('--london_lives_index', type=str, default='', help='path to index of London Lives document years written by data_reader.py (to split London Lives documents by year)')
     parser.add_argument('--vis', default=False, action='store_true', help='whether or not to visualize')
     parser.add_argument('--gensim', default=False, action='store_true', help='whether or not to use gensim\'s lda mallet wrapper')
     parser.add_argument('--seed', type=int, default=0, help='random seed to make deterministic')
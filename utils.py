@@ -1,4 +1,5 @@
-import os, argparse, natsort, sys, re
+import os, argparse, natsort, sys, re, heapq, tempfile, gzip, lzma, hashlib, mmap, bisect
+from array import array
 from datetime import datetime
 
 # Mapping between tokenized contractions to equivalent words
@@ -22,6 +23,60 @@ def timestamp():
     """
     return "["+datetime.now().strftime('%Y-%m-%d %H:%M:%S')+"]"
 
+# File extensions for each type of compression
+compress_ext = {"gzip": ".gz", "lzma": ".xz"}
+
+def compressed_path(path, compress):
+    """
+        Add the extension for a type of compression ("gzip", "lzma" or "" for
+        none) to a path.
+    """
+    if compress and compress not in compress_ext:
+        print(timestamp() + " Unknown compression \"" + compress + "\", use one of " + ", ".join(compress_ext), file=sys.stderr)
+        sys.exit(1)
+    return path + compress_ext.get(compress, "")
+
+def strip_compression(path):
+    """
+        Remove a compression extension (".gz", ".xz" or ".lzma") from a path.
+    """
+    base, ext = os.path.splitext(path)
+    return base if ext in [".gz", ".xz", ".lzma"] else path
+
+def open_file(path, mode="r"):
+    """
+        Open a file that may be compressed with gzip or lzma. When reading,
+        compression is detected from the first bytes of the file, so compressed
+        and plain files can be read the same way. When writing, compression is
+        chosen by the extension of path (".gz", ".xz" or ".lzma").
+
+        input: path to file and mode as for open()
+        returns file object
+    """
+    if mode[0] == "r":
+        with open(path, "rb") as f:
+            magic = f.read(6)
+        if magic[:2] == b"\x1f\x8b": opener = gzip.open
+        elif magic == b"\xfd7zXZ\x00" or magic[:3] == b"\x5d\x00\x00": opener = lzma.open
+        else: return open(path, mode)
+    else:
+        ext = os.path.splitext(path)[1]
+        if ext == ".gz": opener = gzip.open
+        elif ext in [".xz", ".lzma"]: opener = lzma.open
+        else: return open(path, mode)
+    # Compressed files are opened in binary mode by default
+    return opener(path, mode if "b" in mode else mode + "t")
+
+def file_hash(path):
+    """
+        Compute the SHA-1 hash of a file's content, reading it in blocks.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
 def get_order(file):
     """
         Function used when sorting files by year. Return the 8 character string
@@ -60,43 +115,428 @@ def get_year(input, include_month=False, tsv=False):
         print(timestamp() + " Skipping invalid file", input, file=sys.stderr)
         return -1
 
+def read_year_index(path):
+    """
+        Read an index of London Lives documents written by data_reader.py.
+
+        input: path to index tsv file (id, year, path)
+        returns dictionary of format {id: year}
+    """
+    index = {}
+    with open_file(path, 'r') as f:
+        next(f)
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            index[cols[0]] = int(cols[1])
+    return index
+
+def doc_index_path(tsv_path):
+    """
+        Path of the document index of a tsv file.
+    """
+    return tsv_path + ".offsets.tsv"
+
+def id_month(id):
+    """
+        Get the month from an Old Bailey document id (e.g., "t17440112-1"), or
+        0 for any other id (e.g., London Lives ids, even with digits in them).
+    """
+    match = re.match("(?:OA|[a-z])?[0-9]{4}([0-9]{2})[0-9]{2}", id)
+    return int(match.group(1)) if match else 0
+
+def build_doc_index(tsv_path):
+    """
+        Find where each document starts in an uncompressed tsv file and write
+        the document index (see load_doc_index).
+
+        input: path to tsv file
+        returns list of index entries (id, year, month, byte offset, length)
+    """
+    entries = []
+    offset = 0
+    with open(tsv_path, "rb") as f:
+        for line in f:
+            text = line.rstrip(b"\r\n")
+            cols = text.decode().split("\t")
+            if text.strip() and cols[0].lower() != "id":
+                year = cols[1] if len(cols) > 1 else ""
+                entries.append((cols[0], year, id_month(cols[0]), offset, len(text)))
+            offset += len(line)
+    stat = os.stat(tsv_path)
+    with open(doc_index_path(tsv_path), "w") as f:
+        f.write("#\t" + str(stat.st_size) + "\t" + str(stat.st_mtime_ns) + "\n")
+        f.write("id\tyear\tmonth\toffset\tlength\n")
+        for entry in entries:
+            f.write("\t".join(str(col) for col in entry) + "\n")
+    return entries
+
+def load_doc_index(tsv_path):
+    """
+        Load the document index of an uncompressed tsv file, building it first
+        if it doesn't exist or the tsv file has changed since it was built. The
+        index is a tsv file next to the tsv file with one line per document:
+        id, year (as in the tsv file), month (from the id, 0 if unknown), byte
+        offset and length in bytes of the line.
+
+        input: path to tsv file
+        returns list of index entries in the order of the tsv file
+    """
+    path = doc_index_path(tsv_path)
+    stat = os.stat(tsv_path)
+    try:
+        with open(path) as f:
+            stamp = f.readline().rstrip("\n").split("\t")
+            if stamp[1:] == [str(stat.st_size), str(stat.st_mtime_ns)]:
+                next(f)
+                entries = []
+                for line in f:
+                    id, year, month, offset, length = line.rstrip("\n").split("\t")
+                    entries.append((id, year, int(month), int(offset), int(length)))
+                return entries
+    except (OSError, IndexError, ValueError, StopIteration):
+        pass
+    print(timestamp() + " Building document index of", tsv_path, file=sys.stderr)
+    return build_doc_index(tsv_path)
+
+# Memory maps of tsv files read by DocHandle, one per file
+doc_maps = {}
+
+class DocHandle:
+    """
+        A document (line) of a tsv file that is only read when it is used.
+        The text is read from a memory map of the file shared by every handle,
+        so no copy of the corpus is kept in memory. A handle can be used like
+        the line it stands for (e.g., doc.split("\t")[2], len(doc), "x" in doc
+        or doc == line), and is pickled as the line itself (e.g., when sent to
+        another process). Use str(doc) where a real string is needed, e.g., for
+        "\n".join().
+    """
+    def __init__(self, path, entry):
+        self.path = path
+        self.id, self.year, self.month, self.offset, self.length = entry
+
+    def text(self):
+        """
+            returns line of tsv file
+        """
+        if self.path not in doc_maps:
+            with open(self.path, "rb") as f:
+                doc_maps[self.path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return doc_maps[self.path][self.offset:self.offset + self.length].decode()
+
+    def __getattr__(self, name):
+        # Use string methods of the line (e.g., split, lower)
+        if name.startswith("__"): raise AttributeError(name)
+        return getattr(self.text(), name)
+
+    def __str__(self):
+        return self.text()
+
+    def __len__(self):
+        return len(self.text())
+
+    def __contains__(self, item):
+        return item in self.text()
+
+    def __iter__(self):
+        return iter(self.text())
+
+    def __getitem__(self, i):
+        return self.text()[i]
+
+    def __eq__(self, other):
+        return self.text() == str(other) if isinstance(other, (str, DocHandle)) else NotImplemented
+
+    def __hash__(self):
+        return hash(self.text())
+
+    def __add__(self, other):
+        return self.text() + other
+
+    def __radd__(self, other):
+        return other + self.text()
+
+    def __reduce__(self):
+        return (str, (self.text(),))
+
+    def __repr__(self):
+        return "DocHandle(" + repr(self.path) + ", " + repr(self.id) + ")"
+
+def indexed_docs(path):
+    """
+        Make a handle for each document of a tsv file, using its document index.
+
+        returns list of DocHandle objects, or None if the file is compressed
+    """
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic[:2] == b"\x1f\x8b" or magic == b"\xfd7zXZ\x00" or magic[:3] == b"\x5d\x00\x00":
+        print(timestamp() + " Can't index compressed file " + path + ", reading all of it instead", file=sys.stderr)
+        return None
+    return [DocHandle(path, entry) for entry in load_doc_index(path)]
+
+class DocSlice:
+    """
+        Documents of one time slice of tsv files, read from disk each time the
+        slice is iterated over instead of kept in memory. Only the file, byte
+        offset and length of each document are stored, so len() works as for
+        a list of lines and slice[i] reads one line. Iterating over the slice
+        yields each line as a string.
+
+        input: list of DocHandle objects
+    """
+    def __init__(self, handles):
+        self.paths = []
+        self.files = array("H")
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        for handle in handles:
+            if handle.path not in self.paths: self.paths.append(handle.path)
+            self.files.append(self.paths.index(handle.path))
+            self.offsets.append(handle.offset)
+            self.lengths.append(handle.length)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            docs = DocSlice([])
+            docs.paths = self.paths
+            docs.files, docs.offsets, docs.lengths = self.files[i], self.offsets[i], self.lengths[i]
+            return docs
+        with open(self.paths[self.files[i]], "rb") as f:
+            f.seek(self.offsets[i])
+            return f.read(self.lengths[i]).decode()
+
+    def __iter__(self):
+        files = [open(path, "rb") for path in self.paths]
+        try:
+            for file, offset, length in zip(self.files, self.offsets, self.lengths):
+                files[file].seek(offset)
+                yield files[file].read(length).decode()
+        finally:
+            for f in files: f.close()
+
+    def __repr__(self):
+        return "DocSlice(" + str(len(self)) + " documents)"
+
+def doc_id(doc):
+    """
+        Get the id of a document: a DocHandle, a tsv line or a path to a text
+        file named after its id.
+    """
+    if isinstance(doc, DocHandle): return doc.id
+    if "\t" in doc: return doc.split("\t", 1)[0]
+    return os.path.splitext(os.path.basename(doc))[0]
+
+def id_date(id):
+    """
+        Get the year and month from a document id (e.g., "t17440112-1").
+
+        returns (year, month) tuple, (-1, 0) if the id doesn't contain a year
+    """
+    offset = 2 if id[:2] == "OA" else 1 if id[:1].isalpha() else 0
+    try:
+        return (int(id[offset:4 + offset]), id_month(id))
+    except ValueError:
+        return (-1, 0)
+
+def doc_source(id):
+    """
+        Get the source of a document from its id: "ordinarys" for Ordinary's
+        accounts, "sessions" for sessions papers (whole sessions, front matter
+        or trials) and "london_lives" for anything else.
+    """
+    if id[:2] == "OA": return "ordinarys"
+    if re.match("[a-z]?[0-9]{8}", id): return "sessions"
+    return "london_lives"
+
+def parse_year_range(expression):
+    """
+        Parse a range expression: comma-separated ranges of the form
+        "START:END", where START and END are "YYYY" or "YYYY-MM" and END is
+        not included (e.g., "1674:1834-10"). Add "/STEP" to split a range
+        into ranges of STEP years (e.g., "1670:1840/10" for decades). Slices
+        are named after the year they start in, so no two ranges can start
+        in the same year.
+
+        input: range expression
+        returns list of ((start year, start month), (end year, end month))
+    """
+    ranges = []
+    for part in expression.split(","):
+        match = re.fullmatch("([0-9]{4})(?:-([0-9]{1,2}))?:([0-9]{4})(?:-([0-9]{1,2}))?(?:/([0-9]+))?", part.strip())
+        if not match:
+            print(timestamp() + " Invalid year range \"" + part + "\", use START:END or START:END/STEP (e.g., 1674:1834-10)", file=sys.stderr)
+            sys.exit(1)
+        start = (int(match.group(1)), int(match.group(2) or 0))
+        end = (int(match.group(3)), int(match.group(4) or 0))
+        step = int(match.group(5) or 0)
+        if not step:
+            ranges.append((start, end))
+            continue
+        while start < end:
+            ranges.append((start, min((start[0] + step, 0), end)))
+            start = (start[0] + step, 0)
+    years = [start[0] for start, end in ranges]
+    if len(set(years)) < len(years):
+        print(timestamp() + " Invalid year range \"" + expression + "\", two ranges start in the same year", file=sys.stderr)
+        sys.exit(1)
+    return ranges
+
+class DocIndex:
+    """
+        Documents sorted by date, to find the documents in a range of years
+        and months, from one source or with a given id prefix, by binary
+        search. The year of a document is taken from year_index if its id is
+        there (e.g., London Lives documents), otherwise from its id.
+
+        input:
+            docs (list): DocHandle objects, tsv lines or paths to text files
+            year_index (dict): years of documents by id (see read_year_index)
+    """
+    def __init__(self, docs, year_index=None):
+        year_index = year_index or {}
+        self.docs = docs
+        self.ids = [doc_id(doc) for doc in docs]
+        self.dates = []
+        for id in self.ids:
+            year, month = id_date(id)
+            self.dates.append((year_index[id], 0) if id in year_index else (year, month))
+        # Keys of each document (year, month, position), sorted
+        self.keys = sorted(date + (i,) for i, date in enumerate(self.dates))
+        self.source_keys = {}
+        for key in self.keys:
+            self.source_keys.setdefault(doc_source(self.ids[key[2]]), []).append(key)
+        self.id_keys = sorted((id, i) for i, id in enumerate(self.ids))
+
+    def select(self, start=None, end=None, source=None, id_prefix=None):
+        """
+            Find documents by date, source and id.
+
+            input:
+                start (tuple): (year, month) of first documents to include
+                end (tuple): (year, month) of first documents not to include
+                source (str): "sessions", "ordinarys" or "london_lives"
+                id_prefix (str): beginning of document ids (e.g., "t1834")
+
+            Documents with no month (e.g., London Lives documents dated by
+            year_index) are included if the range includes any of their year.
+
+            returns list of documents, sorted by date
+        """
+        if id_prefix:
+            low = bisect.bisect_left(self.id_keys, (id_prefix,))
+            high = bisect.bisect_left(self.id_keys, (id_prefix + "\uffff",))
+            keys = sorted(self.dates[i] + (i,) for _, i in self.id_keys[low:high])
+        else:
+            keys = self.source_keys.get(source, []) if source else self.keys
+        # Ending before January leaves out the whole year, as ending at month 0
+        if end and end[1] == 1: end = (end[0], 0)
+        low = bisect.bisect_left(keys, start) if start else 0
+        high = bisect.bisect_left(keys, end) if end else len(keys)
+        selected = keys[low:high]
+        # Documents of the first year with no month sort before its months
+        if start and start[1] and (not end or start < end):
+            selected = keys[bisect.bisect_left(keys, (start[0], 0)):bisect.bisect_left(keys, (start[0], 1))] + selected
+        positions = [key[2] for key in selected]
+        if id_prefix and source:
+            positions = [i for i in positions if doc_source(self.ids[i]) == source]
+        return [self.docs[i] for i in positions]
+
+    def slices(self, expression):
+        """
+            Split documents into slices by a range expression (see
+            parse_year_range), leaving out empty slices.
+
+            returns dictionary of format {first year: [doc0,doc1,...]}, with
+            the first year of each range as an int (as with order_files)
+        """
+        slices = {}
+        for start, end in parse_year_range(expression):
+            docs = self.select(start, end)
+            if docs: slices[start[0]] = docs
+        return slices
+
 def order_files(args):
     """
         Sort a list of input files by years.
 
         input: args
         output: dictionary of format {"YYYY":[file0,file1,...], "YYYY+args.year_split":[file0,file1,...]}
+                (or one slice per range in args.year_range, see parse_year_range)
                 and time slices:: [a, b, c]
+                With args.lazy_slices, each slice of a tsv corpus is a DocSlice
+                that reads its documents from disk when iterated over.
     """
     # If given tsv file as input, order documents based on year
     tsv = False
-    try:
-        with open(args.tsv_corpus, 'r') as f:
-            lines = f.read().split("\n")
-
-            if lines[0].lower() == "id\tyear\ttext": idx = 1
-            else: idx = 0
-            lines = [line for line in lines[idx:] if line.rstrip()]
-            tsv = True
-        # If there was an input london lives tsv file, add that to the documents
+    lines = None
+    lazy = getattr(args, "lazy_slices", False)
+    # Use handles of documents in the tsv files instead of reading them (the
+    # scripts' default tsv_corpus is a placeholder, not a file, when reading a
+    # directory of files)
+    if (getattr(args, "doc_index", False) or lazy) and os.path.isfile(getattr(args, "tsv_corpus", "")):
+        lines = indexed_docs(args.tsv_corpus)
+        if lines is not None and os.path.isfile(getattr(args, "london_lives_file", "")):
+            ll_lines = indexed_docs(args.london_lives_file)
+            lines = lines + ll_lines if ll_lines is not None else None
+    if lines is not None:
+        tsv = True
+        docs = natsort.natsorted(lines, key=lambda x: x.year)
+    else:
+        lazy = False
         try:
-            with open(args.london_lives_file, 'r') as f:
-                ll_lines = f.read().split("\n")
-                ll_lines = [line for line in ll_lines if line.rstrip()]
-            lines += ll_lines
-        except: pass
-        docs = natsort.natsorted(lines, key=lambda x: x.split("\t")[1])
+            with open_file(args.tsv_corpus, 'r') as f:
+                lines = f.read().split("\n")
+
+                if lines[0].lower() == "id\tyear\ttext": idx = 1
+                else: idx = 0
+                lines = [line for line in lines[idx:] if line.rstrip()]
+                tsv = True
+            # If there was an input london lives tsv file, add that to the documents
+            try:
+                with open_file(args.london_lives_file, 'r') as f:
+                    ll_lines = f.read().split("\n")
+                    if ll_lines[0].lower() == "id\tyear\ttext": ll_lines = ll_lines[1:]
+                    ll_lines = [line for line in ll_lines if line.rstrip()]
+                lines += ll_lines
+            except: pass
+            docs = natsort.natsorted(lines, key=lambda x: x.split("\t")[1])
 
-    # Otherwise, input is directory of files
-    except:
-        docs = [os.path.join(args.corpus_dir, f) for f in os.listdir(args.corpus_dir)
-                 if (os.path.isfile(os.path.join(args.corpus_dir, f))
-                     and re.match(".*[0-9]{8}", f) and f.endswith('.txt'))]
+        # Otherwise, input is directory of files
+        except:
+            docs = [os.path.join(args.corpus_dir, f) for f in os.listdir(args.corpus_dir)
+                     if (os.path.isfile(os.path.join(args.corpus_dir, f))
+                         and re.match(".*[0-9]{8}", f) and f.endswith('.txt'))]
 
-        docs = natsort.natsorted(docs, key=lambda x: get_order(x))  # Sort in ascending numeric order
+            docs = natsort.natsorted(docs, key=lambda x: get_order(x))  # Sort in ascending numeric order
+
+    # London Lives ids don't contain a year, look them up in the index instead
+    try:
+        year_index = read_year_index(args.london_lives_index) if args.london_lives_index else {}
+    except AttributeError:
+        year_index = {}
+    def doc_year(doc):
+        if isinstance(doc, DocHandle):
+            return year_index[doc.id] if doc.id in year_index else get_year(doc.id)
+        if tsv and doc.split("\t", 1)[0] in year_index:
+            return year_index[doc.split("\t", 1)[0]]
+        return get_year(doc, tsv=tsv)
+
+    # Stream documents of each slice from disk instead of keeping them
+    def make_slices(docs_dict):
+        if not lazy: return docs_dict
+        return {year: DocSlice(doc_list) for year, doc_list in docs_dict.items()}
+
+    # Split by range expression if given
+    if getattr(args, "year_range", ""):
+        docs_dict = make_slices(DocIndex(docs, year_index).slices(args.year_range))
+        return [docs_dict, [len(doc_list) for year, doc_list in docs_dict.items()]]
 
     # Find start year
-    start_year = get_year(docs[0], tsv=tsv)
+    start_year = doc_year(docs[0])
     docs_dict = {start_year:[]}
 
     # Determine if we want to split by year
@@ -108,11 +548,11 @@ def order_files(args):
     # If no split, just return docs as is
     if year_split == -1:
         docs_dict[start_year] = docs
-        return [docs_dict, len(docs)]
+        return [make_slices(docs_dict), len(docs)]
 
     for doc in docs:
         # Get year for current document
-        cur_year = get_year(doc, tsv=tsv)
+        cur_year = doc_year(doc)
         # If year returned is -1, indicates invalid
         if cur_year == -1: continue
         # Check if current year is at least year_split years away from the start
@@ -120,4 +560,182 @@ def order_files(args):
             start_year = cur_year
             docs_dict[start_year] = []
         docs_dict[start_year].append(doc)
+    docs_dict = make_slices(docs_dict)
     return [docs_dict, [len(doc_list) for year, doc_list in docs_dict.items()]]
+
+class ExternalSort:
+    """
+        Sort lines that may not fit in memory. Lines are buffered until the
+        buffer holds buffer_size characters, then sorted and written to a
+        temporary file. Iterating over the object merges the sorted files.
+
+        Lines are ordered by key(line), with ties broken by the order number
+        passed to add(), so the result is the same as a stable sort of the
+        lines listed in order of their order numbers. Lines must not contain
+        "\n" (other line breaks such as "\r" are kept as they are).
+    """
+    def __init__(self, key, buffer_size, tmp_dir=None):
+        self.key = key
+        self.buffer_size = buffer_size
+        self.tmp_dir = tmp_dir
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+
+    def add(self, line, order):
+        """
+            Add a line with the given (unique) order number.
+        """
+        self.buffer.append((self.key(line), order, line))
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_size:
+            self.spill()
+
+    def spill(self):
+        """
+            Write the sorted buffer to a temporary file.
+        """
+        self.buffer.sort()
+        # Don't translate newlines, so only "\n" ends a row
+        run = tempfile.TemporaryFile("w+", newline="\n", dir=self.tmp_dir)
+        for _, order, line in self.buffer:
+            run.write(str(order) + "\t" + line + "\n")
+        run.seek(0)
+        self.runs.append(run)
+        self.buffer = []
+        self.buffered = 0
+
+    def read_run(self, run):
+        """
+            Yield the lines of a temporary file in the same format as the buffer.
+        """
+        for row in run:
+            order, line = row[:-1].split("\t", 1)
+            yield (self.key(line), int(order), line)
+        run.close()
+
+    def __iter__(self):
+        self.buffer.sort()
+        runs = [self.read_run(run) for run in self.runs]
+        for _, _, line in heapq.merge(self.buffer, *runs):
+            yield line
+        self.buffer = []
+        self.runs = []
+
+# Files of a token id corpus (see TokenIdWriter)
+token_id_files = ["vocab.txt", "tokens.bin", "offsets.bin", "docs.tsv"]
+
+class TokenIdWriter:
+    """
+        Write a tokenized corpus as integer token ids to a directory, so it can
+        be loaded without splitting text again (see TokenCorpus):
+            vocab.txt: one token per line, the id of a token is its line number
+            tokens.bin: token ids of every document, one after another
+                (unsigned 32-bit little-endian integers)
+            offsets.bin: index in tokens.bin where each document starts, plus
+                the total number of tokens (unsigned 64-bit little-endian)
+            docs.tsv: id and year of each document, one document per line
+
+        Documents are added one at a time and written out as they are added.
+        A writer can continue from a state returned by state() after
+        truncating anything written since.
+    """
+    def __init__(self, path, state=None):
+        self.path = path
+        if not os.path.exists(path): os.makedirs(path)
+        paths = [os.path.join(path, file) for file in token_id_files]
+        self.vocab = {}
+        if state:
+            for file_path, size in zip(paths, state["bytes"]):
+                os.truncate(file_path, size)
+            with open(paths[0]) as f:
+                for token in f.read().split("\n")[:-1]:
+                    self.vocab[token] = len(self.vocab)
+            self.num_tokens = state["tokens"]
+        self.files = [open(file_path, mode) for file_path, mode in
+                      zip(paths, ["a", "ab", "ab", "a"] if state else ["w", "wb", "wb", "w"])]
+        if not state:
+            self.num_tokens = 0
+            self.write_ints("Q", 2, [0])
+
+    def write_ints(self, typecode, i, values):
+        """
+            Write integers to self.files[i] in little-endian order.
+        """
+        values = array(typecode, values)
+        if sys.byteorder == "big": values.byteswap()
+        values.tofile(self.files[i])
+
+    def add(self, id, year, text):
+        """
+            Add a document given its id, year and tokenized text.
+        """
+        new_tokens = []
+        ids = []
+        for token in text.split():
+            if token not in self.vocab:
+                self.vocab[token] = len(self.vocab)
+                new_tokens.append(token)
+            ids.append(self.vocab[token])
+        if new_tokens: self.files[0].write("\n".join(new_tokens) + "\n")
+        self.write_ints("I", 1, ids)
+        self.num_tokens += len(ids)
+        self.write_ints("Q", 2, [self.num_tokens])
+        self.files[3].write(id + "\t" + year + "\n")
+
+    def state(self):
+        """
+            Flush files to disk.
+
+            returns dictionary of file sizes and number of tokens written
+        """
+        for f in self.files:
+            f.flush()
+            os.fsync(f.fileno())
+        return {"bytes": [os.fstat(f.fileno()).st_size for f in self.files], "tokens": self.num_tokens}
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+class TokenCorpus:
+    """
+        Token id corpus written by TokenIdWriter. Token ids and offsets are
+        memory-mapped with numpy, so loading takes as long as reading the
+        vocab and document ids, whatever the size of the corpus.
+
+        corpus[i] is a numpy array of the token ids of document i,
+        corpus.words(i) is the list of its tokens, and iterating over corpus
+        gives the token id array of each document in order.
+    """
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        with open(os.path.join(path, "vocab.txt")) as f:
+            self.vocab = f.read().split("\n")[:-1]
+        with open(os.path.join(path, "docs.tsv")) as f:
+            docs = [line.rstrip("\n").split("\t") for line in f]
+        self.ids = [doc[0] for doc in docs]
+        self.years = [int(doc[1]) for doc in docs]
+        self.offsets = np.memmap(os.path.join(path, "offsets.bin"), dtype="<u8", mode="r")
+        if self.offsets[-1] > 0:
+            self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype="<u4", mode="r")
+        else:
+            # numpy can't map an empty file
+            self.tokens = np.zeros(0, dtype="<u4")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def words(self, i):
+        """
+            returns list of tokens in document i
+        """
+        return [self.vocab[id] for id in self[i]]
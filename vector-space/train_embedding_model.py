@@ -79,6 +79,69 @@ def find_n_neighbors(args, pre, model_dict):
     print(timestamp() + " Wrote top", args.find_n_neighbors, "neighbors to", tsv_path, file=sys.stderr)
     return neighbor_dict
 
+class SliceCorpus:
+    """
+        Tokens of each document of a DocSlice, read from disk again each time
+        the corpus is iterated over (once to build the vocab and once per
+        epoch of training), so the slice is never held in memory.
+    """
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __iter__(self):
+        for line in self.docs:
+            yield "\t".join(line.split("\t")[2:]).lower().split()
+
+    def __len__(self):
+        return len(self.docs)
+
+class TokenIdSlice:
+    """
+        Tokens of some documents of a TokenCorpus (written by run_tokenize.py
+        --token_ids), looked up from their token ids each time the slice is
+        iterated over, so the text is never split again.
+    """
+    def __init__(self, corpus, docs):
+        self.corpus = corpus
+        self.docs = docs
+        self.vocab = [word.lower() for word in corpus.vocab]
+
+    def __iter__(self):
+        for i in self.docs:
+            yield [self.vocab[id] for id in self.corpus[i]]
+
+    def __len__(self):
+        return len(self.docs)
+
+def token_id_slices(args, corpus):
+    """
+        Split the documents of a TokenCorpus by year, the same way order_files
+        splits a tsv corpus (by args.year_range if given, otherwise into
+        slices of args.year_split years).
+
+        input:
+            args (argparse object): input arguments
+            corpus (TokenCorpus): token id corpus
+
+        returns dictionary of format {first year: TokenIdSlice}
+    """
+    if args.year_range:
+        # Years of documents whose ids don't contain one (e.g., London Lives)
+        year_index = {id: year for id, year in zip(corpus.ids, corpus.years) if id_date(id)[0] == -1}
+        positions = {id: i for i, id in enumerate(corpus.ids)}
+        slices = DocIndex(corpus.ids, year_index).slices(args.year_range)
+        return {year: TokenIdSlice(corpus, [positions[id] for id in ids]) for year, ids in slices.items()}
+
+    slices = {}
+    start_year = None
+    for i in sorted(range(len(corpus)), key=lambda i: corpus.years[i]):
+        year = corpus.years[i]
+        if start_year is None or (args.year_split != -1 and year - start_year >= args.year_split):
+            start_year = year
+            slices[start_year] = []
+        slices[start_year].append(i)
+    return {year: TokenIdSlice(corpus, docs) for year, docs in slices.items()}
+
 def build_corpus(args, input_dir_path=None, files=None, corpus_txt_file=None):
     """
         Function to build a corpus (list of contents of files) based on input
@@ -92,10 +155,17 @@ def build_corpus(args, input_dir_path=None, files=None, corpus_txt_file=None):
             corpus_txt_file (str): filepath to corpus.txt file output from
                 running Mallet
 
-        returns list of words representing corpus
+        returns list of words representing corpus (or SliceCorpus if files is
+        a DocSlice, or files itself if it is a TokenIdSlice)
     """
+    # Token ids are already split into tokens
+    if isinstance(files, TokenIdSlice):
+        corpus = files
+    # Stream the slice from disk rather than compiling it
+    elif args.tsv_corpus and isinstance(files, DocSlice):
+        corpus = SliceCorpus(files)
     # If input tsv file, compile the third column of all
-    if args.tsv_corpus:
+    elif args.tsv_corpus:
         corpus = []
         for line in files:
             text = line.split("\t")[2:]
@@ -105,19 +175,19 @@ def build_corpus(args, input_dir_path=None, files=None, corpus_txt_file=None):
                      if (os.path.isfile(os.path.join(input_dir_path, f)) and f.endswith('.txt'))]
         corpus = []
         for file in files:
-            with open(file) as f:
+            with open_file(file) as f:
                 corpus.append(f.read().lower().split())
     elif files:
         corpus = []
         for file in files:
-            with open(file) as f:
+            with open_file(file) as f:
                 corpus.append(f.read().lower().split())
     # If input corpus.txt file output from Mallet's --print-output flag
     elif corpus_txt_file:
         print(timestamp(),"Building corpus from file...", file=sys.stderr)
         corpus = []
         doc_words = []
-        with open(corpus_txt_file, 'r') as f:
+        with open_file(corpus_txt_file, 'r') as f:
             content = f.read()
             lines = content.split("\n")
             for line in lines:
@@ -208,7 +278,11 @@ def main(args):
 
         else:
             # Order files by year
-            files_dict, _ = order_files(args)
+            if args.token_corpus:
+                print(timestamp(), "Loading token ids from " + args.token_corpus, file=sys.stderr)
+                files_dict = token_id_slices(args, TokenCorpus(args.token_corpus))
+            else:
+                files_dict, _ = order_files(args)
 
             print(timestamp(), "Data will be saved to directory " + pre, file=sys.stderr)
             model_dict = {}
@@ -257,6 +331,9 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--tsv_corpus', type=str, default="", help='path to corpus file in tsv format')
+    parser.add_argument('--doc_index', default=False, action="store_true", help='whether or not to read documents of the tsv corpus through a document index (built next to it the first time) instead of loading the whole file')
+    parser.add_argument('--lazy_slices', default=False, action="store_true", help='whether or not to read the documents of each time slice from the tsv corpus every time they are used instead of keeping them in memory (uses the document index, see --doc_index)')
+    parser.add_argument('--token_corpus', type=str, default="", help='path to token id directory written by run_tokenize.py --token_ids, to train on instead of splitting the text of a tsv corpus again')
     parser.add_argument('--corpus_txt_file', type=str, default="", help='path to corpus file saved from mallet --print_output')
     parser.add_argument('--corpus_dir', type=str, default="/work/clambert/thesis-data/sessionsAndOrdinarys-txt-tok-lower-lemma", help='directory containing corpus')
     parser.add_argument('--save_model_dir', type=str, default="/work/clambert/models/", help='base directory for saving model directory')
@@ -266,6 +343,8 @@ if __name__ == '__main__':
     parser.add_argument('--find_n_neighbors', type=int, default=0, help='how many nearest neighbors to find')
     parser.add_argument('--epochs', type=int, default=100, help='how many epochs')
     parser.add_argument('--year_split', type=int, default=100, help='number of years to include in each chunk of corpus (run tf-idf over each chunk)')
+    parser.add_argument('--year_range', type=str, default='', help='ranges of years to split corpus into, overriding --year_split (e.g., "1674:1834-10", "1670:1840/10" for decades or "1689:1702,1702:1714")')
+    parser.add_argument('--london_lives_index', type=str, default='', help='path to index of London Lives document years written by data_reader.py (to split London Lives documents by year)')
     parser.add_argument('-f', action='store_true', help='use fasttext model instead of word2vec')
     parser.add_argument('--print_similarity', action='store_true', default=False, help='whether or not to print out similarities')
     args = parser.parse_args()